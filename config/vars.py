@@ -8,6 +8,8 @@ seisan_definitions_path = '/seismo/seisan/DAT/SEISAN.DEF'  # Path to def file (u
 archives_path = '/seismo/archive'                    # Path to archives
 stations_save_path = home_directory + 'stations'  # Where to save stations list (station-picker)
 stations_load_path = home_directory + 'stations'  # Leave empty if want to generate stations list in process
+catalog_cache_path = home_directory + 'catalog.sqlite'  # Parsed S-files cache (reparses only changed S-files)
+use_catalog_cache = True  # If False - S-files are parsed on every run
 
 # CALCULATED GENERAL PATH VARIABLES
 readings_path = path + rea_path  # Partial path to S-files
@@ -24,6 +26,14 @@ static_slice_offset = slice_duration/2  # Center the pick
 
 archive_channels_order = ['N', 'E', 'Z']  # Specifies channels to pick
 
+archive_cache_size = 2 * 1024 ** 3  # Max size in bytes of decoded day archives kept in memory (0 - disable caching)
+windowed_archive_reads = True  # If True - decode only miniSEED records which overlap picks slices
+use_archive_file_index = True  # If True - archives existence is checked with scanned archives directory index
+archive_file_index_path = home_directory + 'archive_index.json'  # Persisted archive files index (empty - not saved)
+mseed_index_cache_files = 1000  # Max number of archives records indexes kept in memory (for windowed reads)
+
+seconds_high_precision = True  # If True - use S-file phase seconds with fractional part, otherwise truncate them
+
 dir_per_event = True  # If True - creates subdir for every event
 
 min_magnitude = 1.5  # Minimal magnitude of events allowed
@@ -32,8 +42,23 @@ max_dist = 300.0  # Maximum distance to station allowed
 
 save_dir = home_directory + 'WAVTest' # 'WAVNoShiftInfo'  # Where to save picks
 
+picking_stats_file = 'picking.stats'  # Name of picking statistics file (saved in save_dir)
+event_stats_file = 'event.stats'  # Name of event description file (saved in every event dir)
+picks_stats_file = 'picks.stats'  # Name of picks description file (saved in every picks dir)
+picks_output_format = 'directory'  # 'directory' - directory per pick, 'packed' - picks appended to shards files
+pick_archive_shard_events = 1000  # Max amount of events in a packed picks shard
+use_picks_index = True  # If True - read_picks selects picks with metadata index instead of reading stats files
+picks_index_file = 'picks_index.npz'  # Name of picks metadata index file (saved in save_dir)
+
+rewrite_duplicates = False  # If True - events which are already saved will be sliced again
+explicit_rewrite_duplicates = False  # If True - rewrite duplicates even when resuming aborted picking
+
+picking_workers = 1  # Number of worker processes for phase-picker (1 - process S-files sequentially)
+planned_slicing = False  # If True - phase-picker reads all S-files first and slices events day archive by day archive
+
 # NOISE PICKING
-max_noise_picks = 10000  # Max amount of noise examples to pick per script run
+max_noise_picks = 10000  # Max amount of noise intervals to pick per script run, every interval is saved as one
+# slice per station channel archive
 
 start_date = [2014, 4, 5]  # Starting date for noise picker
 end_date = [2019, 1, 1]    # End date for noise picker
@@ -41,6 +66,17 @@ end_date = [2019, 1, 1]    # End date for noise picker
 tolerate_events_in_same_day = False  # If False - noise picker will ignore days when actual recorded events happend
 event_tolerance = 15  # Number of seconds around noise trace which should not contain any events
 
+noise_sta = 2.5  # STA window length in seconds for noise picks trigger
+noise_lta = 10.  # LTA window length in seconds for noise picks trigger
+noise_trigger_on = 3.5  # STA/LTA trigger on threshold
+noise_trigger_off = 0.5  # STA/LTA trigger off threshold, trigger turns on again only after STA/LTA falls to it
+noise_workers = 1  # Number of worker processes for noise-picker, if more than 1 - days are picked in parallel
+noise_seed = 0  # Seed of noise intervals sampling, same seed gives same noise picks
+noise_stratified_sampling = True  # If True - noise intervals are sampled equally by station, month and hour of day
+noise_block_bytes = 128 * 1024  # Size of day archive blocks decoded at once while searching for a noise trigger
+noise_day_windows = 24  # Station day is split into this amount of equal windows, first trigger onset of every window
+# gives a noise interval candidate (trigger turns on at noise_trigger_on and off at noise_trigger_off)
+
 noise_save_dir = home_directory + 'NoiseFixed'  # Where to save noise picks
 if len(noise_save_dir) == 0:  # Grab path from picks_slicing is not set
     noise_save_dir = save_dir
@@ -52,6 +88,7 @@ month_length = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
 hdf5_file_name = home_directory + 'WAVTest.hdf5'  # Name to save composed hdf5 file under
 
 required_df = 100  # Required frequency of hdf5 traces for GPD
+polyphase_resampling = True  # If true - resample with cached polyphase filters, otherwise with ObsPy (FFT)
 required_trace_length = 400  # Required amount of samples (basically length*frequency)
 
 hdf5_array_length = 100  # Amount of S/P-picks and noise picks
@@ -67,6 +104,17 @@ acc_codes = ['ENE', 'ENN', 'ENZ', 'HNE', 'HNN', 'HNZ']  # Codes for accelerogram
 save_ids = True  # If true, will add new dataset with events IDs
 ids_dataset_name = 'Z'  # Name for dataset with events IDs
 
+hdf5_chunk_size = 1000  # Amount of picks in hdf5 datasets chunk, picks are written by batches of this size
+hdf5_compression = None  # Compression of hdf5 datasets: 'gzip', 'lzf' or None
+hdf5_compression_level = 4  # Compression level for 'gzip' compression (0-9)
+hdf5_memmap = True  # If True - contiguous hdf5 datasets are read with numpy.memmap (see utils/hdf5_reader.py)
+hdf5_memmap_block_size = 1000000  # Amount of mapped labels counted at once
+hdf5_merge_seed = 0  # Seed of picks permutation in hdf5-merge.py
+hdf5_merge_block_size = 10000  # Amount of picks read and written at once by hdf5-merge.py
+
+processing_jobs = 1  # Number of worker processes for picks preprocessing, if 1 - picks are processed sequentially
+processing_batch_size = 16  # Amount of picks sent to a preprocessing worker at once
+
 order_of_channels = ['Z', 'N', 'E']  # Order of channels for hdf5 set
 
 detrend = True  # If True, perform detrend
@@ -75,6 +123,9 @@ highpass_filter_df = 2  # High-pass filter frequency, if 1, filter disabled
 
 normalization_enabled = True  # If true - normalize picks
 
+batch_processing = True  # If true - detrend, filter, integrate and normalize picks in batches with NumPy/SciPy,
+#                          ..otherwise every pick is processed with ObsPy
+
 global_max_normalizing = True  # If true, will normalize waveform by all traces in stream
 
 p_picks_dir_per_event = True  # Are p-wave picks organized with sub-dirs for each event
@@ -104,6 +155,8 @@ Options:
 -s, --save \t arg : directory to save picks traces
 -r, --rea \t arg : s-files database main directory
 -w. --wav \t arg : waveforms database main directory
+--workers \t arg : number of worker processes (phase-picker only)
+--plan \t\t : slice events in chronological order, reading every day archive once (phase-picker only)
 This script slices a list of events picks waveforms, according to picks in s-files. 
 It tries to get picks from continious archives if avaliable, rather than from WAV database."""
 
@@ -116,21 +169,55 @@ Options:
 -d, --def \t arg : full path to SEISAN.DEF (including filename)
 -s, --start \t arg : start date in format DD.MM.YYYY
 -e, --end \t arg : end date in format DD.MM.YYYY
--m, --max_picks \t arg : maximum number of noise picks
+-m, --max_picks \t arg : maximum number of noise intervals, every interval is saved as one slice per station
+\t\t\t   channel archive
 -a, --archives \t arg : path to continious archives files directory
 --output_level \t arg : logging level from 1 to 5
 --offset \t arg : maximum picks offset 
 --duration \t arg : pick duration
-This script slices a list of noise picks wich passed STA/LTA trigger but not described in any of s-files."""
+--workers \t arg : number of worker processes, if more than 1 - days are picked in parallel
+--seed \t\t arg : noise intervals sampling seed
+This script slices a list of noise picks wich passed STA/LTA trigger but not described in any of s-files.
+Noise intervals are found for the whole date range, up to noise_day_windows per station day (one per hour by default),
+and max_picks of them are sampled by station, month and hour.
+Progress of worker processes is printed with output_level 3 and above, traces details - with 4 and above."""
 
 stations_help_message = """Usage: python stations-picker.py [options]
 Options: 
 -h, --help \t\t : print this help message and exit
 -s, --save \t arg : full path for generated stations list file
 -r, --rea \t arg : s-files database main directory
-This script generates list of all stations, which registered atleast one event in current database."""
+This script generates list of all stations, which registered atleast one event in current database.
+Every line of the list contains station name and amount of its picks separated by tab.
+If catalog cache is enabled, only new or changed s-files are parsed."""
 
 hdf5_creator_help_message = """Usage: python hdf5-creator.py [options]
 Options: 
--h, --help \t\t : print this help message and exit"""
+-h, --help \t\t : print this help message and exit
+--jobs \t\t arg : number of worker processes for picks preprocessing
+--rebuild-index \t : compile picks metadata index again reading event directories, use after
+\t\t\t   event directories were changed manually"""
 
+hdf5_merge_help_message = """Usage: python hdf5-merge.py [options] [stats file ...]
+Options: 
+-h, --help \t\t : print this help message and exit
+--limit \t arg : stats: maximum of picks to analyse, default: all picks
+--ids \t\t : stats: count unique and duplicated IDs of Z dataset
+Without arguments merges datasets set in the script. With "stats" prints statistics of every file as a line of JSON:
+picks counts by label and by source, IDs duplicates and X traces summary."""
+
+resample_benchmark_help_message = """Usage: python resample-benchmark.py [options]
+Options: 
+-h, --help \t\t : print this help message and exit
+--rates \t arg : comma separated list of input sampling rates, default: 200,250,500
+--picks \t arg : amount of picks resampled with every method, default: 1000
+--duration \t arg : duration of picks in seconds, default: slice_duration
+This script compares speed and spectral fidelity of ObsPy FFT resampling and polyphase resampling
+to required_df."""
+
+mseed_window_check_help_message = """Usage: python mseed-window-check.py [options] file ...
+Options: 
+-h, --help \t\t : print this help message and exit
+--duration \t arg : duration of checked windows in seconds, default: slice_duration
+This script places windows on every boundary between consecutive miniSEED records of the files and checks that
+windowed reads (see utils/mseed_window.py) accept and reject the same windows as whole file reads."""
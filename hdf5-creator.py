@@ -1,19 +1,38 @@
 import sys
 import getopt
 import logging
-import utils.hdf5_composer as composer
+import utils.hdf5_writer as hdf5_writer
+import utils.processing_pool as processing_pool
 import utils.utils as utils
-import random
 
 import config.vars as config
 
+
+def picks_tasks(files, noise=False):
+    """
+    Generates processing tasks (see hdf5_composer.process_task) for picks files lists
+    :param files: list      - list of picks files lists, returned by utils.get_files
+    :param noise: bool      - True if picks are noise picks
+    :return: generator of tasks
+    """
+    for file_list in files:
+        task_files = []
+        for file in file_list[:3]:
+            parameters = {}
+            if noise:
+                parameters['noise'] = True
+            task_files.append((file, parameters))
+
+        yield task_files, file_list[3], True
+
+
 # Main function body
 if __name__ == "__main__":
     # Parse script parameters
     argv = sys.argv[1:]
 
     try:
-        opts, args = getopt.getopt(argv, 'hs:r:w:', ["help", "save=", "rea=", "wav="])
+        opts, args = getopt.getopt(argv, 'hs:r:w:', ["help", "save=", "rea=", "wav=", "jobs="])
     except getopt.GetoptError:
         logging.error(str(getopt.GetoptError))
         sys.exit(2)
@@ -23,11 +42,12 @@ if __name__ == "__main__":
             logging.info(config.hdf5_creator_help_message)
             print(config.hdf5_creator_help_message)
             sys.exit()
+        elif opt == "--jobs":
+            config.processing_jobs = int(arg)
 
-    # Initialize main variables
-    p_picks = []
-    s_picks = []
-    noise_picks = []
+    # Picks are processed in parallel and written to hdf5 as soon as they are processed
+    pool = processing_pool.ProcessingPool(config.processing_jobs)
+    writer = hdf5_writer.HDF5Writer(config.hdf5_file_name)
 
     # Get P picks
     if config.p_picks_dir_per_event:
@@ -35,31 +55,10 @@ if __name__ == "__main__":
     else:
         files = utils.get_files(config.p_picks_path, 0, 0, r'\.P')
 
-    for file_list in files:
-        pick_list = []
-        skip = False
-        index = -1
-        for file in file_list:
-            index += 1
-            if index >= 3:
-                break
-
-            if config.slice_offset_start == 0 and config.slice_offset_end == 0:
-                time_shift = 0
-            else:
-                time_shift = random.randrange(config.slice_offset_start, config.slice_offset_end)
-
-            pick = composer.process(file, rand=time_shift)
-            if pick is None:
-                skip = True
-                break
-            pick_list.append([pick, file, file_list[3]])
-            if len(pick) != config.required_trace_length:
-                skip = True
-                break
-        if skip:
+    for pick_list in pool.imap(picks_tasks(files)):
+        if pick_list is None:
             continue
-        p_picks.append(pick_list)
+        writer.append(pick_list, config.p_code, pick_list[0].event_id)
 
     # Get S picks
     if config.s_picks_dir_per_event:
@@ -67,58 +66,20 @@ if __name__ == "__main__":
     else:
         files = utils.get_files(config.s_picks_path, 0, 0, r'\.S')
 
-    for file_list in files:
-        pick_list = []
-        skip = False
-        index = -1
-        for file in file_list:
-            index += 1
-            if index >= 3:
-                break
-
-            if config.slice_offset_start == 0 and config.slice_offset_end == 0:
-                time_shift = 0
-            else:
-                time_shift = random.randrange(config.slice_offset_start, config.slice_offset_end)
-
-            pick = composer.process(file, rand=time_shift)
-            if pick is None:
-                skip = True
-                break
-            pick_list.append([pick, file, file_list[3]])
-            if len(pick) != config.required_trace_length:
-                skip = True
-                break
-        if skip:
+    for pick_list in pool.imap(picks_tasks(files)):
+        if pick_list is None:
             continue
-        s_picks.append(pick_list)
+        writer.append(pick_list, config.s_code, pick_list[0].file_name)
 
     # Get noise picks
     files = utils.get_files(config.noise_picks_hdf5_path, 0, 0, r'\.N', is_noise=True)
-    for file_list in files:
-        pick_list = []
-        skip = False
-        index = -1
-        for file in file_list:
-            index += 1
-            if index >= 3:
-                break
-
-            if config.slice_offset_start == 0 and config.slice_offset_end == 0:
-                time_shift = 0
-            else:
-                time_shift = random.randrange(config.slice_offset_start, config.slice_offset_end)
-
-            pick = composer.process(file, rand=time_shift, noise=True)
-            if pick is None:
-                skip = True
-                break
-            pick_list.append([pick, file, file_list[3]])
-            if len(pick) != config.required_trace_length:
-                skip = True
-                break
-        if skip:
+    for pick_list in pool.imap(picks_tasks(files, noise=True)):
+        # Noise picks amount is limited by S picks amount
+        if writer.count(config.noise_code) >= writer.count(config.s_code):
+            break
+        if pick_list is None:
             continue
-        noise_picks.append(pick_list)
+        writer.append(pick_list, config.noise_code, pick_list[0].file_name)
 
-    composer.compose(config.hdf5_file_name, p_picks, s_picks, noise_picks)
\ No newline at end of file
+    pool.close()
+    writer.close()
@@ -5,7 +5,10 @@ import random
 
 import config.vars as config
 import utils.picks_slicing as picker
+import utils.picks_index as picks_index
 import utils.hdf5_composer as hdf5
+import utils.hdf5_writer as hdf5_writer
+import utils.processing_pool as processing_pool
 import utils.utils as utils
 
 # Main function body
@@ -14,16 +17,26 @@ if __name__ == "__main__":
     argv = sys.argv[1:]
 
     try:
-        opts, args = getopt.getopt(argv, 'hs:r:w:', ["help", "save=", "rea=", "wav="])
+        opts, args = getopt.getopt(argv, 'hs:r:w:', ["help", "save=", "rea=", "wav=", "jobs=", "rebuild-index"])
     except getopt.GetoptError:
         logging.error(str(getopt.GetoptError))
         sys.exit(2)
 
+    rebuild_index = False
     for opt, arg in opts:
         if opt in ("-h", "--help"):
             logging.info(config.hdf5_creator_help_message)
             print(config.hdf5_creator_help_message)
             sys.exit()
+        elif opt == "--jobs":
+            config.processing_jobs = int(arg)
+        elif opt == "--rebuild-index":
+            rebuild_index = True
+
+    if rebuild_index:
+        picks_index.rebuild(config.p_picks_path, config.output_level)
+        if utils.normalize_path(config.s_picks_path) != utils.normalize_path(config.p_picks_path):
+            picks_index.rebuild(config.s_picks_path, config.output_level)
 
     # Slices lists
     p_picks = ['P']
@@ -34,9 +47,18 @@ if __name__ == "__main__":
     p_picks.append(picker.read_picks(config.p_picks_path, 'P'))
     s_picks.append(picker.read_picks(config.s_picks_path, 'S'))
 
-    # Process picks
-    p_processed = hdf5.process_pick_list(p_picks)
-    s_processed = hdf5.process_pick_list(s_picks)
+    # Process picks and write them to hdf5
+    pool = processing_pool.ProcessingPool(config.processing_jobs)
+    writer = hdf5_writer.HDF5Writer(config.hdf5_file_name)
+    for pick in hdf5.iterate_pick_list(p_picks, pool):
+        writer.append(pick, config.p_code, pick[0].event_id)
+
+    s_start = writer.size
+    for pick in hdf5.iterate_pick_list(s_picks, pool):
+        writer.append(pick, config.s_code, pick[0].file_name)
+
+    # S picks are used as noise picks
+    writer.copy(s_start, writer.size, config.noise_code)
 
-    # Compose hdf5
-    hdf5.compose(config.hdf5_file_name, p_processed, s_processed, s_processed)
+    pool.close()
+    writer.close()
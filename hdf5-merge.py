@@ -1,6 +1,11 @@
+import sys
+import json
+import getopt
+import logging
+import numpy as np
 import h5py as h5
 import config.vars as config
-import random
+import utils.hdf5_reader as hdf5_reader
 
 
 def analyse_dataset(file, max_length=-1):
@@ -17,23 +22,15 @@ def analyse_dataset(file, max_length=-1):
         print("{} set length: {}".format(key, len(file[key])))
 
     # Calculate picks
-    p_picks_count = 0
-    s_picks_count = 0
-    n_picks_count = 0
+    reader = hdf5_reader.HDF5Reader(file)
+    counts = reader.label_counts('Y', max_length)
+    reader.close()
+    p_picks_count = counts.get(config.p_code, 0)
+    s_picks_count = counts.get(config.s_code, 0)
+    n_picks_count = counts.get(config.noise_code, 0)
 
-    index = 0
-    for x in file['Y']:
-        if x == config.p_code:
-            p_picks_count += 1
-        if x == config.s_code:
-            s_picks_count += 1
-        if x == config.noise_code:
-            n_picks_count += 1
-
-        index += 1
-        if 0 <= max_length <= index:
-            print("Analysing finished at position {}".format(index))
-            break
+    if 0 <= max_length <= len(file['Y']):
+        print("Analysing finished at position {}".format(max_length))
 
     print("P-picks count: {}".format(p_picks_count),
           "S-picks count: {}".format(s_picks_count),
@@ -42,55 +39,225 @@ def analyse_dataset(file, max_length=-1):
     print("\n")
 
 
-def merge(files, save_path):
+def label_name(code):
+    """
+    :param code: int    - Y code
+    :return: string     - 'P', 'S' and 'N' for config.p_code, config.s_code and config.noise_code, otherwise code
+    """
+    names = {config.p_code: 'P', config.s_code: 'S', config.noise_code: 'N'}
+    return names.get(code, str(code))
+
+
+def add_counts(counts, keys):
+    """
+    Adds amounts of keys to counts
+    :param counts: dict             - {key: amount}
+    :param keys:   numpy.ndarray    - keys
+    """
+    values, values_counts = np.unique(keys, return_counts=True)
+    for value, count in zip(values.tolist(), values_counts.tolist()):
+        counts[value] = counts.get(value, 0) + count
+
+
+def dataset_statistics(file, max_length=-1, ids=False):
+    """
+    Computes dataset statistics: datasets lengths, picks counts by label, picks counts by source (if Z dataset holds
+    source codes, see merge), IDs duplicates (if Z dataset holds IDs and ids is True) and X traces summary: traces
+    with NaN values, zero traces, per trace max absolute amplitude and per channel mean and standard deviation of
+    finite values. Datasets are read by blocks of config.hdf5_chunk_size picks, so memory does not depend on dataset
+    size (except for IDs set)
+    :param file: hdf5 file
+    :param max_length: maximum of items to analyse, do not limit if negative
+    :param ids: if True - count unique and duplicated IDs of Z dataset
+    :return: dict - statistics, can be serialized to JSON
+    """
+    reader = hdf5_reader.HDF5Reader(file)
+    length = len(file['Y']) if max_length < 0 else min(max_length, len(file['Y']))
+    has_x = 'X' in file and len(file['X']) >= length
+    z_name = config.ids_dataset_name
+    has_z = z_name in file and len(file[z_name]) >= length
+    sources = has_z and file[z_name].dtype.kind in 'iu'
+    ids = ids and has_z and not sources
+
+    labels = {}
+    source_labels = {}  # {source code: {label: amount}}
+    id_counts = {}  # {ID: amount}
+    nan_traces = 0
+    zero_traces = 0
+    amplitude_sum = 0.
+    amplitude_min = np.inf
+    amplitude_max = -np.inf
+    channel_count = None
+    channel_sum = None
+    channel_squares = None
+
+    for start in range(0, length, reader.block_size):
+        end = min(length, start + reader.block_size)
+        y = np.asarray(reader.batch(start, end, 'Y'))
+        add_counts(labels, y)
+
+        if sources:
+            z = np.asarray(reader.batch(start, end, z_name))
+            for source in np.unique(z).tolist():
+                add_counts(source_labels.setdefault(source, {}), y[z == source])
+        elif ids:
+            add_counts(id_counts, np.asarray(reader.batch(start, end, z_name)))
+
+        if has_x:
+            x = np.asarray(reader.batch(start, end, 'X'), dtype=np.float64)
+            if x.ndim == 2:
+                x = x[:, :, np.newaxis]
+            finite = np.isfinite(x)
+            values = np.where(finite, x, 0.)
+
+            nan_traces += int(np.isnan(x).any(axis=(1, 2)).sum())
+            zero_traces += int((x == 0).all(axis=(1, 2)).sum())
+
+            amplitudes = np.abs(values).max(axis=(1, 2))
+            amplitude_sum += float(amplitudes.sum())
+            amplitude_min = min(amplitude_min, float(amplitudes.min()))
+            amplitude_max = max(amplitude_max, float(amplitudes.max()))
+
+            if channel_count is None:
+                channel_count = np.zeros(x.shape[-1], dtype=np.int64)
+                channel_sum = np.zeros(x.shape[-1], dtype=np.float64)
+                channel_squares = np.zeros(x.shape[-1], dtype=np.float64)
+            channel_count += finite.sum(axis=(0, 1))
+            channel_sum += values.sum(axis=(0, 1))
+            channel_squares += (values * values).sum(axis=(0, 1))
+
+    reader.close()
+
+    statistics = {'file': file.filename,
+                  'datasets': {key: len(file[key]) for key in file.keys()},
+                  'picks': length,
+                  'labels': {label_name(x): labels[x] for x in sorted(labels)}}
+    if sources:
+        statistics['sources'] = {str(x): {'picks': sum(source_labels[x].values()),
+                                          'labels': {label_name(y): source_labels[x][y] for y in
+                                                     sorted(source_labels[x])}}
+                                 for x in sorted(source_labels)}
+    if ids:
+        statistics['ids'] = {'unique': len(id_counts),
+                             'duplicated': sum(1 for x in id_counts.values() if x > 1),
+                             'duplicated_picks': sum(x for x in id_counts.values() if x > 1)}
+    if has_x and length > 0:
+        means = channel_sum / np.maximum(channel_count, 1)
+        deviations = np.sqrt(np.maximum(channel_squares / np.maximum(channel_count, 1) - means * means, 0.))
+        statistics['traces'] = {'nan': nan_traces,
+                                'zero': zero_traces,
+                                'max_amplitude': {'min': amplitude_min, 'max': amplitude_max,
+                                                  'mean': amplitude_sum / length},
+                                'channels': [{'mean': float(means[i]), 'std': float(deviations[i]),
+                                              'finite': int(channel_count[i])} for i in range(len(means))]}
+
+    return statistics
+
+
+def merge(files, save_path, seed=None, block_size=None):
     """
-    Merges two datasets together
+    Merges datasets together and shuffles picks. Output position of every pick is set by a seeded permutation
+    computed up front, inputs are read by blocks of consecutive picks and every block is scattered to its positions
+    in preallocated output datasets. Output datasets are contiguous, so they are written through numpy.memmap (see
+    utils/hdf5_reader.py) and memory used is bounded by the block size
+    :param files: list of dicts: {"filename": path, "file": opened hdf5 file, "index": Z code of the file picks,
+                  "limit": max amount of picks taken from the file, do not limit if negative or not set}
     :param save_path: path to write new dataset
-    :param file_2_limit: limit amount of picks for merging from set 2, do not limit if negative
-    :return:
+    :param seed: seed of picks permutation, default - config.hdf5_merge_seed
+    :param block_size: amount of picks read at once, default - config.hdf5_merge_block_size
+    :return: -1 - error
     """
-    print("Merging")
+    if seed is None:
+        seed = config.hdf5_merge_seed
+    if block_size is None:
+        block_size = config.hdf5_merge_block_size
+    block_size = max(1, block_size)
 
-    X = []
-    Y = []
-    Z = []  # If 0, then element came from the first archive, else - from the second
+    print("Merging")
 
     progress_bar_length = 20
 
-    for f in files:
-        print("Processing {}..".format(f["filename"]))
-        file = f["file"]
-
-        length = len(file['X'])
+    if len(files) == 0:
+        logging.error("No datasets to merge")
+        return -1
 
+    # Amount of picks taken from every file
+    limits = []
+    for f in files:
+        length = len(f["file"]['X'])
         limit = -1 if "limit" not in f.keys() else f["limit"]
         if 0 > limit or limit > length:
             limit = length
+        limits.append(limit)
+    total = sum(limits)
 
-        index = 0
-        while index < limit:
-            X.append(file['X'][index])
-            Y.append(file['Y'][index])
-            Z.append(f["index"])
-            progress_bar(index, limit, progress_bar_length)
-            index += 1
-
-        print("\n\n", end="")
+    shape = files[0]["file"]['X'].shape[1:]
+    for f in files:
+        if f["file"]['X'].shape[1:] != shape:
+            logging.error("Dataset {} picks shape {} differs from {}".format(f["filename"], f["file"]['X'].shape[1:],
+                                                                           shape))
+            return -1
 
-    # Shuffle
-    zipped = list(zip(X, Y, Z))
-    random.shuffle(zipped)
-    X_result, Y_result, Z_result = zip(*zipped)
+    # Output position of every pick, files picks follow each other
+    positions = np.random.RandomState(seed).permutation(total)
 
-    # Save dataset
+    # Create output datasets
     print("\n\nWriting to {}..".format(save_path))
     file = h5.File(save_path, "w")
+    datasets = {'X': file.create_dataset('X', shape=(total,) + shape, dtype=files[0]["file"]['X'].dtype),
+                'Y': file.create_dataset('Y', shape=(total,), dtype=files[0]["file"]['Y'].dtype),
+                'Z': file.create_dataset('Z', shape=(total,), dtype=np.int64)}
+
+    # Storage of contiguous dataset is allocated on first write, then datasets can be mapped. Datasets are mapped
+    # again for every block, so written pages are released after every block
+    layouts = None  # {dataset name: (dtype, offset in file, shape)}
+    if total > 0 and config.hdf5_memmap:
+        for dataset in datasets.values():
+            dataset[total - 1] = np.zeros(dataset.shape[1:], dtype=dataset.dtype)
+        file.flush()
+        mapped = [(name, hdf5_reader.map_dataset(x, save_path, 'r+')) for name, x in datasets.items()]
+        if all(x is not None for _, x in mapped):
+            layouts = {name: (x.dtype, x.offset, x.shape) for name, x in mapped}
+        del mapped
+    if layouts is not None:
+        file.close()
 
-    dset1 = file.create_dataset('X', data=X_result)
-    dset2 = file.create_dataset('Y', data=Y_result)
-    dset3 = file.create_dataset('Z', data=Z_result)
+    start = 0  # Position of file first pick in the permutation
+    for f, limit in zip(files, limits):
+        print("Processing {}..".format(f["filename"]))
+        # Inputs are read through hdf5 library by large blocks, so read pages are not kept mapped
+        reader = hdf5_reader.HDF5Reader(f["file"], use_mapping=False)
 
-    file.close()
+        for index in range(0, limit, block_size):
+            end = min(limit, index + block_size)
+
+            # Block picks are written in increasing order of positions
+            block_positions = positions[start + index:start + end]
+            order = np.argsort(block_positions)
+            targets = block_positions[order]
+
+            outputs = datasets
+            if layouts is not None:
+                outputs = {name: np.memmap(save_path, mode='r+', dtype=dtype, offset=offset, shape=shape)
+                           for name, (dtype, offset, shape) in layouts.items()}
+
+            outputs['X'][targets] = reader.batch(index, end, 'X')[order]
+            outputs['Y'][targets] = reader.batch(index, end, 'Y')[order]
+            outputs['Z'][targets] = f["index"]
+
+            if layouts is not None:
+                for x in outputs.values():
+                    x.flush()
+            del outputs
+
+            progress_bar(end, limit, progress_bar_length)
+
+        reader.close()
+        start += limit
+        print("\n\n", end="")
+
+    if layouts is None:
+        file.close()
     print("Done!")
 
 
@@ -119,6 +286,36 @@ def progress_bar(count, total, blocks_total):
 
 # Main function body
 if __name__ == "__main__":
+    # Parse script parameters
+    argv = sys.argv[1:]
+
+    try:
+        opts, args = getopt.getopt(argv, 'h', ["help", "limit=", "ids"])
+    except getopt.GetoptError:
+        logging.error(str(getopt.GetoptError))
+        sys.exit(2)
+
+    stats_limit = -1
+    stats_ids = False
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(config.hdf5_merge_help_message)
+            sys.exit()
+        elif opt == "--limit":
+            stats_limit = int(arg)
+        elif opt == "--ids":
+            stats_ids = True
+
+    # Statistics subcommand: one JSON line per file
+    if len(args) > 0 and args[0] == 'stats':
+        if len(args) < 2:
+            print(config.hdf5_merge_help_message)
+            sys.exit(2)
+        for filename in args[1:]:
+            with h5.File(filename, "r") as stats_file:
+                print(json.dumps(dataset_statistics(stats_file, stats_limit, stats_ids)))
+        sys.exit()
+
     home = "/seismo/seisan/WOR/chernykh/"
 
     files = [{"filename": home + "dagestan.hdf5", "index": 0},
@@ -0,0 +1,104 @@
+import sys
+import getopt
+import logging
+from obspy.core import UTCDateTime
+from obspy.io.mseed.core import _read_mseed as read_mseed
+
+import utils.mseed_window as mseed_window
+import config.vars as config
+
+
+def covers(stream, start_time, end_time):
+    """
+    Checks if any trace covers the window the same way picks_slicing.get_picks does
+    :param stream:     obspy.core.stream.Stream
+    :param start_time: UTCDateTime  - window start
+    :param end_time:   UTCDateTime  - window end
+    :return: bool
+    """
+    for trace in stream:
+        if not (trace.stats.starttime > start_time or end_time >= trace.stats.endtime):
+            return True
+    return False
+
+
+def boundary_windows(index, duration):
+    """
+    Returns windows with an edge placed on every boundary between consecutive records: at the last sample of a
+    record, in the middle of the gap till the next record and at the first sample of the next record
+    :param index:    RecordIndex    - records index of the file
+    :param duration: float          - window duration in seconds
+    :return: [(float, float)]       - windows start and end timestamps
+    """
+    windows = []
+    for i in range(1, len(index.starts)):
+        previous_end = index.ends[i - 1]
+        start = index.starts[i]
+        if start == float('inf') or previous_end == float('-inf'):
+            continue
+        for edge in (previous_end, (previous_end + start) / 2, start):
+            windows.append((edge, edge + duration))
+            windows.append((edge - duration, edge))
+    return windows
+
+
+def check(path, duration):
+    """
+    Compares windowed and whole file reads of a miniSEED file for windows placed on records boundaries
+    :param path:     string - path to miniSEED file
+    :param duration: float  - window duration in seconds
+    :return: (int, int)     - (windows checked, windows with different result)
+             None           - file cannot be read by windows
+    """
+    index = mseed_window.reader.index(path)
+    if index is None:
+        return None
+
+    whole = read_mseed(path)
+    mismatches = 0
+    windows = boundary_windows(index, duration)
+    for start, end in windows:
+        start_time = UTCDateTime(start)
+        end_time = UTCDateTime(end)
+        windowed = covers(mseed_window.read_window(path, start_time, end_time), start_time, end_time)
+        if windowed != covers(whole, start_time, end_time):
+            mismatches += 1
+            print('{}: window {} - {}: windowed read {}, whole file read {}'.format(
+                path, start_time, end_time, 'accepts' if windowed else 'rejects',
+                'rejects' if windowed else 'accepts'))
+
+    return len(windows), mismatches
+
+
+# Main function body
+if __name__ == "__main__":
+    # Parse script parameters
+    argv = sys.argv[1:]
+
+    duration = config.slice_duration
+
+    try:
+        opts, args = getopt.getopt(argv, 'h', ["help", "duration="])
+    except getopt.GetoptError:
+        logging.error(str(getopt.GetoptError))
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(config.mseed_window_check_help_message)
+            sys.exit()
+        elif opt == "--duration":
+            duration = float(arg)
+
+    total_mismatches = 0
+    for path in args:
+        result = check(path, duration)
+        if result is None:
+            print('{}: not a fixed record length single channel miniSEED file, windowed reads are not used'.format(
+                path))
+            continue
+        print('{}: {} windows checked, {} mismatches'.format(path, result[0], result[1]))
+        total_mismatches += result[1]
+
+    if total_mismatches > 0:
+        sys.exit(1)
@@ -6,8 +6,14 @@ import random
 
 import utils.utils as utils
 import utils.picks_slicing as picks
+import utils.catalog_cache as catalog_cache
+import utils.archive_cache as archive_cache
+import utils.archive_files as archive_files
 import utils.seisan_reader as seisan
 import utils.picking_stats as stats
+import utils.picking_pool as picking_pool
+import utils.pick_archive as pick_archive
+import utils.slicing_planner as planner
 
 import config.vars as config
 
@@ -17,7 +23,7 @@ if __name__ == "__main__":
     argv = sys.argv[1:]
 
     try:
-        opts, args = getopt.getopt(argv, 'hs:r:w:', ["help", "save=", "rea=", "wav="])
+        opts, args = getopt.getopt(argv, 'hs:r:w:', ["help", "save=", "rea=", "wav=", "workers=", "plan"])
     except getopt.GetoptError:
         logging.error(str(getopt.GetoptError))
         sys.exit(2)
@@ -33,6 +39,10 @@ if __name__ == "__main__":
             config.full_readings_path = arg
         elif opt in ("-w", "--wav"):
             config.full_waveforms_path = arg
+        elif opt == "--workers":
+            config.picking_workers = int(arg)
+        elif opt == "--plan":
+            config.planned_slicing = True
 
     # Initialize random seed with current time
     random.seed()
@@ -40,6 +50,9 @@ if __name__ == "__main__":
     # Get file names
     nordic_file_names = utils.get_nordic_files(utils.normalize_path(config.full_readings_path))
 
+    # Open parsed S-files cache
+    catalog = catalog_cache.open_catalog(config.output_level)
+
     # Get all archive definitions
     definitions = []
     if type(config.seisan_definitions_path) is list:
@@ -48,24 +61,27 @@ if __name__ == "__main__":
             definitions.extend(defs)
     else:
         definitions = seisan.read_archive_definitions(utils.normalize_path(config.seisan_definitions_path))
+    definitions = seisan.ArchiveIndex(definitions)
 
     # Picking statistics initialization
     stats = stats.PickStats()
+    stats_path = utils.normalize_path(config.save_dir) + '/' + config.picking_stats_file
 
     rewrite_duplicates = config.rewrite_duplicates
     last_try_error = False
     last_try_error_id = ""
-    last_try_error_file = ""
+    last_try_error_files = []
 
     try:
-        stats.read(utils.normalize_path(config.save_dir) + '/' + config.picking_stats_file)
+        stats.read(stats_path)
         if not stats.finished:
             rewrite_duplicates = False
             last_try_error = True
             if type(stats.error_event_id) is str:
                 last_try_error_id = stats.error_event_id
+            last_try_error_files = list(stats.files_in_progress)
             if type(stats.file_currently_parsed) is str:
-                last_try_error_file = stats.file_currently_parsed
+                last_try_error_files.append(stats.file_currently_parsed)
     except FileNotFoundError as e:
         print("No picking statistics found, starting from anew!")
 
@@ -76,12 +92,59 @@ if __name__ == "__main__":
     stats.finished = False
     stats.file_currently_parsed = None
     stats.error_event_id = None
+    stats.files_in_progress = []
     stats.last_run_files_parsed = 0
     stats.last_run_events_parsed = 0
     stats.last_run_phases_parsed = 0
 
+    if not os.path.isdir(utils.normalize_path(config.save_dir)):
+        os.makedirs(utils.normalize_path(config.save_dir))
+
+    # Scan archives directory once, so workers check archives existence with the index
+    if config.use_archive_file_index:
+        archive_files.get_index(config.output_level)
+
+    pool = picking_pool.PickingPool(config.picking_workers, definitions)
+
+    # IDs of events saved to packed picks shards (for directory output event directories are checked)
+    packed_events = None
+    if config.picks_output_format == 'packed':
+        packed_events = pick_archive.saved_event_ids(utils.normalize_path(config.save_dir))
+
+    # Planner for event-time-ordered slicing
+    plan = None
+    planned_ids = set()
+    if config.planned_slicing:
+        plan = planner.SlicingPlan(definitions, config.output_level)
+
+    def commit(file, result):
+        """
+        Updates picking statistics with finished file
+        :param file:   string   path to S-file
+        :param result: int      number of saved phases, -1 on error or None if file was skipped
+        """
+        if result is not None and result != -1:
+            stats.total_events_parsed += 1
+            stats.last_run_events_parsed += 1
+            stats.total_phases_parsed += result
+            stats.last_run_phases_parsed += result
+
+        # Update&Save picking statistics
+        stats.last_file_parsed = file
+        stats.files_in_progress = pool.in_progress()
+        stats.total_files_parsed += 1
+        stats.last_run_files_parsed += 1
+
+        stats.write(stats_path)
+
+    def collect():
+        """
+        Collects the oldest dispatched file and updates picking statistics
+        """
+        file, event_id, result = pool.collect()
+        commit(file, result)
+
     for file in nordic_file_names:
-        stats.file_currently_parsed = file
         error = False
 
         # Check if file exists
@@ -90,50 +153,103 @@ if __name__ == "__main__":
             err_message = 'no file found! Skipping..'
             print('In file {}: {}'.format(file, err_message))
 
-        # Get event ID
+        # Parse S-file and get event ID
         if not error:
-            try:
-                event_id = picks.get_event_id(file)
-            except UnicodeDecodeError as e:
+            events = catalog_cache.read_events(file, catalog, config.output_level)
+            if events == -1:
                 error = True
-                err_message = str(e)
+                err_message = 'cannot parse S-file! Skipping..'
                 print('In file {}: {}'.format(file, err_message))
 
+        if not error:
+            event_id = ''
+            if len(events) > 0 and events[0].event_id is not None:
+                event_id = events[0].event_id
+
         if not error and len(event_id) == 0:
             error = True
             err_message = 'no event ID found! Skipping..'
             print('In file {}: {}'.format(file, err_message))
 
+        process_event = False
+        rewrite_event = False
         if not error:
+            # Wait for the same event from another S-file to be saved
+            while pool.event_in_progress(event_id):
+                collect()
+
             # Check if event needs to be processed or ignored
             process_event = rewrite_duplicates
+            rewrite_event = rewrite_duplicates
 
-            # Process event if it caused error on last try
+            # Process event if it caused error on last try (and remove its partially saved picks)
             if last_try_error and not process_event:
-                if file == last_try_error_file or event_id == last_try_error_id:
+                if file in last_try_error_files or event_id == last_try_error_id:
                     process_event = True
+                    rewrite_event = True
 
             # Duplicates check
             if not process_event:
                 # Check if event not already written
-                if not utils.event_exists(utils.normalize_path(config.save_dir) + '/' + event_id):
+                if packed_events is not None:
+                    if event_id not in packed_events:
+                        process_event = True
+                elif not utils.event_exists(utils.normalize_path(config.save_dir) + '/' + event_id):
                     process_event = True
 
-            # Process event
-            if process_event:
-                # Get picks
-                slices = picks.get_picks(file, definitions)
-
-                if slices != -1:
-                    # Save picks
-                    picks.save_picks(slices, config.save_dir)
-
-                    # Update picking statistics
-
-        # Update&Save picking statistics
-        stats.last_file_parsed = stats.file_currently_parsed
-        stats.file_currently_parsed = None
-        stats.total_files_parsed += 1
-        stats.last_run_files_parsed += 1
-
-        stats.write(utils.normalize_path(config.save_dir) + '/' + config.picking_stats_file)
+            if packed_events is not None and process_event:
+                packed_events.add(event_id)
+
+        # Add event to slicing plan, it will be sliced after all S-files are read
+        if plan is not None and process_event:
+            process_event = False
+            if event_id not in planned_ids:
+                event = picks.get_single_event(file, events)
+                if event != -1:
+                    plan.add((file, rewrite_event), event)
+                    planned_ids.add(event_id)
+                    continue
+
+        # Dispatch event
+        if pool.full():
+            collect()
+
+        # Files are recorded as in progress before slicing, so they will be sliced again after abort
+        stats.files_in_progress = pool.in_progress() + [file]
+        stats.write(stats_path)
+
+        if process_event:
+            pool.submit(file, event_id, events, config.save_dir, rewrite_event)
+        else:
+            pool.submit(file, None)
+
+    while len(pool.in_progress()) > 0:
+        collect()
+
+    pool.close()
+
+    # Slice planned events day archive by day archive
+    if plan is not None:
+        for task, slices in plan.run():
+            file, rewrite_event = task
+            stats.files_in_progress = [file]
+            stats.write(stats_path)
+
+            result = -1
+            if slices != -1:
+                if rewrite_event:
+                    picks.remove_event(slices.event_id, config.save_dir)
+                if picks.save_picks(slices, config.save_dir) != -1:
+                    result = len(slices.picks)
+
+            commit(file, result)
+
+    stats.files_in_progress = []
+    stats.finished = True
+    stats.write(stats_path)
+
+    if catalog is not None:
+        catalog.close()
+
+    if config.output_level >= 3 and config.picking_workers <= 1:
+        print(str(archive_cache.cache))
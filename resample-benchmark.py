@@ -0,0 +1,112 @@
+import sys
+import time
+import getopt
+import logging
+import numpy as np
+from obspy.core import Trace, Stream
+from scipy.signal import welch
+
+import utils.batch_processing as batch_processing
+import config.vars as config
+
+
+def test_signal(seed=0):
+    """
+    Generates band-limited test signal: sum of random sinusoids below 0.8 of output Nyquist frequency
+    :param seed:    int     - random generator seed
+    :return: (numpy.ndarray, numpy.ndarray, numpy.ndarray)  - frequencies, amplitudes and phases of sinusoids
+    """
+    rng = np.random.RandomState(seed)
+    frequencies = rng.uniform(0.5, 0.8 * config.required_df / 2, 20)
+    amplitudes = rng.uniform(0.1, 1.0, 20)
+    phases = rng.uniform(0, 2 * np.pi, 20)
+    return frequencies, amplitudes, phases
+
+
+def evaluate(signal, df, samples):
+    """
+    Evaluates test signal at provided sampling rate
+    :param signal:  tuple   - test signal (see test_signal)
+    :param df:      float   - sampling rate
+    :param samples: int     - amount of samples
+    :return: numpy.ndarray
+    """
+    frequencies, amplitudes, phases = signal
+    t = np.arange(samples) / float(df)
+    waves = np.sin(2 * np.pi * frequencies[:, np.newaxis] * t + phases[:, np.newaxis])
+    return (amplitudes[:, np.newaxis] * waves).sum(axis=0)
+
+
+def fidelity(resampled, expected):
+    """
+    Compares resampled signal with expected one (edges are excluded)
+    :param resampled: numpy.ndarray
+    :param expected:  numpy.ndarray
+    :return: (float, float) - relative RMS error and max power spectral density deviation in passband (dB)
+    """
+    edge = len(expected) // 10
+    resampled = resampled[edge:len(expected) - edge]
+    expected = expected[edge:len(expected) - edge]
+
+    rms = np.sqrt(np.mean((resampled - expected) ** 2)) / np.sqrt(np.mean(expected ** 2))
+
+    frequencies, resampled_psd = welch(resampled, config.required_df, nperseg=min(256, len(expected)))
+    frequencies, expected_psd = welch(expected, config.required_df, nperseg=min(256, len(expected)))
+    passband = (frequencies > 1) & (frequencies < 0.8 * config.required_df / 2) & \
+               (expected_psd > expected_psd.max() * 1e-3)
+    psd_error = np.abs(10 * np.log10(resampled_psd[passband] / expected_psd[passband])).max()
+
+    return rms, psd_error
+
+
+# Main function body
+if __name__ == "__main__":
+    # Parse script parameters
+    argv = sys.argv[1:]
+
+    rates = [200, 250, 500]
+    picks = 1000
+    duration = config.slice_duration
+
+    try:
+        opts, args = getopt.getopt(argv, 'h', ["help", "rates=", "picks=", "duration="])
+    except getopt.GetoptError:
+        logging.error(str(getopt.GetoptError))
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(config.resample_benchmark_help_message)
+            sys.exit()
+        elif opt == "--rates":
+            rates = [float(x) for x in arg.split(',')]
+        elif opt == "--picks":
+            picks = int(arg)
+        elif opt == "--duration":
+            duration = float(arg)
+
+    print('{:>8} {:>10} {:>12} {:>12} {:>12} {:>12}'.format('rate', 'method', 'time, s', 'picks/s', 'rms error',
+                                                             'psd error, dB'))
+    for df in rates:
+        samples = int(duration * df)
+        signal = test_signal()
+        data = np.tile(evaluate(signal, df, samples), (picks, 1))
+
+        # ObsPy FFT resampling of every trace
+        start = time.time()
+        for row in data:
+            st = Stream([Trace(row.copy(), header={'sampling_rate': df})])
+            st.resample(config.required_df)
+        fft_time = time.time() - start
+        fft_result = st[0].data
+
+        # Polyphase resampling of the whole batch
+        start = time.time()
+        poly_result = batch_processing.resample_batch(data, df, config.required_df)
+        poly_time = time.time() - start
+
+        expected = evaluate(signal, config.required_df, len(fft_result))
+        for method, seconds, result in (('fft', fft_time, fft_result), ('polyphase', poly_time, poly_result[0])):
+            rms, psd_error = fidelity(result, expected)
+            print('{:>8} {:>10} {:>12.3f} {:>12.0f} {:>12.2e} {:>12.3f}'.format(df, method, seconds,
+                                                                               picks / seconds, rms, psd_error))
@@ -10,6 +10,8 @@ from obspy.core import utcdatetime
 from pprint import pprint
 
 import utils.picks_slicing as picks
+import utils.catalog_cache as catalog_cache
+import utils.archive_cache as archive_cache
 import utils.seisan_reader as seisan
 import utils.converter as converter
 import config.vars as config
@@ -55,7 +57,10 @@ if __name__ == "__main__":
             logging.info(x)
 
     # Get all archive definitions
-    definitions = seisan.read_archive_definitions(config.seisan_definitions_path)
+    definitions = seisan.ArchiveIndex(seisan.read_archive_definitions(config.seisan_definitions_path))
+
+    # Open parsed S-files cache
+    catalog = catalog_cache.open_catalog(config.output_level)
 
     # Get and process all files with picks
     events_total = 0
@@ -74,7 +79,8 @@ if __name__ == "__main__":
     next_stop = 1.0
     step = 1.0
     for file in nordic_file_names:
-        slices = picks.slice_from_reading(file, config.full_waveforms_path, config.slice_duration, definitions, config.output_level)
+        slices = picks.slice_from_reading(file, config.full_waveforms_path, config.slice_duration, definitions,
+                                          config.output_level, catalog)
 
         tot += 1
         if slices == -1:
@@ -89,4 +95,10 @@ if __name__ == "__main__":
         proc = proc*100
         if proc > next_stop:
             print("PROGRESS: " + str(next_stop) + '%')
-            next_stop += step
\ No newline at end of file
+            next_stop += step
+
+    if catalog is not None:
+        catalog.close()
+
+    if config.output_level >= 3:
+        print(str(archive_cache.cache))
@@ -9,6 +9,7 @@ import random
 from obspy.core import utcdatetime
 
 import utils.picks_slicing as picks
+import utils.catalog_cache as catalog_cache
 import utils.seisan_reader as seisan
 import utils.converter as converter
 import config.vars as config
@@ -52,9 +53,12 @@ if __name__ == "__main__":
             logging.info(x)
 
     # Get all stations
-    stations = picks.get_stations(nordic_file_names, config.output_level)
+    catalog = catalog_cache.open_catalog(config.output_level)
+    station_counts = picks.get_station_counts(nordic_file_names, config.output_level, catalog)
+    if catalog is not None:
+        catalog.close()
 
-    stations = sorted(stations)
+    stations = sorted(station_counts)
 
     if os.path.isfile(config.stations_save_path):
         logging.error('File already exists')
@@ -62,7 +66,8 @@ if __name__ == "__main__":
 
     f = open(config.stations_save_path, 'w')
 
+    # Every line: station name and amount of its picks
     for x in stations:
-        f.write(x + '\r\n')
+        f.write(x + '\t' + str(station_counts[x]) + '\r\n')
 
     f.close()
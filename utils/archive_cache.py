@@ -0,0 +1,119 @@
+import os
+from collections import OrderedDict
+import obspy.core
+
+import utils.mseed_window as mseed_window
+import config.vars as config
+
+
+class ArchiveCache:
+    """
+    Bounded LRU cache of decoded day archives streams, keyed by (archive path, modification time).
+    Cached streams are shared between consumers and must not be modified in place (use trace.slice or copies)
+    """
+
+    def __init__(self, max_size):
+        """
+        :param max_size: int    max total size of cached traces data in bytes, if 0 - caching disabled
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.streams = OrderedDict()  # {(path, mtime): (Stream, size)}
+        self.keys = {}  # {path: (path, mtime)} - current key of every cached path
+
+    def read(self, path):
+        """
+        Returns decoded archive stream, reads archive only if it is not cached or was changed since caching
+        :param path: string     path to archive file
+        :return: obspy.core.stream.Stream
+        Raises same exceptions as obspy.core.read
+        """
+        key = (path, os.path.getmtime(path))
+        cached = self.streams.get(key)
+        if cached is not None:
+            self.hits += 1
+            self.streams.move_to_end(key)
+            return cached[0]
+
+        self.misses += 1
+        stream = obspy.core.read(path)
+        if self.max_size <= 0:
+            return stream
+
+        # Drop outdated version of the archive
+        if path in self.keys:
+            self.remove(self.keys[path])
+
+        size = 0
+        for trace in stream:
+            size += trace.data.nbytes
+
+        self.streams[key] = (stream, size)
+        self.keys[path] = key
+        self.size += size
+
+        # Evict least recently used archives
+        while self.size > self.max_size and len(self.streams) > 1:
+            self.remove(next(iter(self.streams)))
+
+        return stream
+
+    def remove(self, key):
+        """
+        Removes archive from cache
+        :param key: (string, float)     archive key (path, modification time)
+        """
+        stream, size = self.streams.pop(key)
+        self.size -= size
+        if self.keys.get(key[0]) == key:
+            del self.keys[key[0]]
+
+    def clear(self):
+        """
+        Removes all cached archives (hit/miss counters are kept)
+        """
+        self.streams = OrderedDict()
+        self.keys = {}
+        self.size = 0
+
+    def __str__(self):
+        """
+        :return: string     cache statistics
+        """
+        total = self.hits + self.misses
+        ratio = float(self.hits) / total if total > 0 else 0.0
+        return 'Archive cache: {} hits, {} misses ({:.1%} hit ratio), {} archives, {} bytes cached'.format(
+            self.hits, self.misses, ratio, len(self.streams), self.size)
+
+
+# Cache shared by all archive consumers of the process
+cache = ArchiveCache(config.archive_cache_size)
+
+
+def read(path):
+    """
+    Reads day archive through the shared cache
+    :param path: string     path to archive file
+    :return: obspy.core.stream.Stream
+    """
+    return cache.read(path)
+
+
+def read_window(path, start_time, end_time):
+    """
+    Reads part of day archive which covers provided time window. If windowed reads are enabled, only miniSEED
+    records overlapping the window are decoded, otherwise (or if archive has no fixed record length) whole archive
+    is read through the shared cache. Traces are not trimmed to the window
+    :param path:       string       path to archive file
+    :param start_time: UTCDateTime  window start
+    :param end_time:   UTCDateTime  window end
+    :return: obspy.core.stream.Stream
+    """
+    if config.windowed_archive_reads:
+        stream = mseed_window.read_window(path, start_time, end_time)
+        if stream is not None:
+            return stream
+
+    return cache.read(path)
@@ -0,0 +1,158 @@
+import os
+import json
+import logging
+
+import utils.seisan_reader as seisan
+import config.vars as config
+
+
+class ArchiveFileIndex:
+    """
+    Index of day archive files available in archives directory (layout: subdir/station/archive files, see
+    seisan_reader.archive_path). Archives directory is scanned once, every station directory is stored with its
+    modification time, so on refresh only station directories which were changed are listed again.
+    Index is used instead of checking every archive path with a stat call
+    """
+
+    def __init__(self, archives_path, path='', output_level=0):
+        """
+        :param archives_path: string    path to archives directory
+        :param path:          string    path to persisted index file, if empty - index is kept only in memory
+        :param output_level:  int       0 - min output, 5 - max output, default - 0
+        """
+        self.root = seisan.normalize_path(archives_path)
+        self.path = path
+        self.output_level = output_level
+        self.directories = {}  # {subdir/station: (mtime, {archive file names})}
+        self.scanned = 0  # Station directories listed during last refresh
+
+    def __len__(self):
+        return sum(len(x[1]) for x in self.directories.values())
+
+    def load(self):
+        """
+        Loads persisted index, index built for another archives directory is ignored
+        """
+        if len(self.path) == 0 or not os.path.isfile(self.path):
+            return
+
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as error:
+            if self.output_level >= 2:
+                logging.warning('Cannot load archive files index ' + self.path + ': ' + str(error))
+            return
+
+        if data.get('root') != self.root:
+            return
+
+        self.directories = {}
+        for directory, (mtime, names) in data['directories'].items():
+            self.directories[directory] = (mtime, set(names))
+
+    def save(self):
+        """
+        Persists index to the file
+        """
+        if len(self.path) == 0:
+            return
+
+        data = {'root': self.root,
+                'directories': {x: [mtime, sorted(names)] for x, (mtime, names) in self.directories.items()}}
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(data, f)
+        except OSError as error:
+            if self.output_level >= 2:
+                logging.warning('Cannot save archive files index ' + self.path + ': ' + str(error))
+
+    def refresh(self):
+        """
+        Scans archives directory, lists only new and changed station directories
+        """
+        directories = {}
+        self.scanned = 0
+
+        for subdir in scan_directories(self.root):
+            for station in scan_directories(subdir.path):
+                directory = subdir.name + '/' + station.name
+                mtime = station.stat().st_mtime
+
+                cached = self.directories.get(directory)
+                if cached is not None and cached[0] == mtime:
+                    directories[directory] = cached
+                    continue
+
+                try:
+                    with os.scandir(station.path) as entries:
+                        names = set(x.name for x in entries if x.is_file())
+                except OSError as error:
+                    if self.output_level >= 2:
+                        logging.warning('In ' + station.path + ': ' + str(error))
+                    continue
+
+                directories[directory] = (mtime, names)
+                self.scanned += 1
+
+        self.directories = directories
+        if self.output_level >= 3:
+            logging.info('Archive files index: {} files, {} of {} station directories listed'.format(
+                len(self), self.scanned, len(self.directories)))
+
+    def exists(self, path):
+        """
+        Checks if archive file exists, paths outside of archives directory are checked with a stat call
+        :param path: string     full path to archive file (see seisan_reader.archive_path)
+        :return: bool
+        """
+        if not path.startswith(self.root + '/'):
+            return os.path.isfile(path)
+
+        directory, name = os.path.split(path[len(self.root) + 1:])
+        cached = self.directories.get(directory)
+        return cached is not None and name in cached[1]
+
+
+def scan_directories(path):
+    """
+    Lists subdirectories
+    :param path: string     path to directory
+    :return: [os.DirEntry]  - subdirectories entries, empty if directory cannot be listed
+    """
+    try:
+        with os.scandir(path) as entries:
+            return [x for x in entries if x.is_dir()]
+    except OSError:
+        return []
+
+
+# Shared index of config.archives_path, built on first use
+index = None
+
+
+def get_index(output_level=0):
+    """
+    Returns shared index of config.archives_path: loads persisted index, refreshes and persists it.
+    Index is rebuilt if config.archives_path was changed
+    :param output_level: int    0 - min output, 5 - max output, default - 0
+    :return: ArchiveFileIndex
+    """
+    global index
+    if index is None or index.root != seisan.normalize_path(config.archives_path):
+        index = ArchiveFileIndex(config.archives_path, config.archive_file_index_path, output_level)
+        index.load()
+        index.refresh()
+        index.save()
+    return index
+
+
+def exists(path):
+    """
+    Checks if archive file exists using shared index, if archive files index is disabled - with a stat call
+    :param path: string     full path to archive file (see seisan_reader.archive_path)
+    :return: bool
+    """
+    if not config.use_archive_file_index:
+        return os.path.isfile(path)
+    return get_index().exists(path)
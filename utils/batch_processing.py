@@ -0,0 +1,133 @@
+from fractions import Fraction
+from functools import lru_cache
+import numpy as np
+from scipy.signal import detrend, iirfilter, sosfilt, zpk2sos, firwin, resample_poly
+
+try:
+    from scipy.integrate import cumulative_trapezoid
+except ImportError:  # scipy < 1.6
+    from scipy.integrate import cumtrapz as cumulative_trapezoid
+
+import config.vars as config
+
+
+@lru_cache(maxsize=None)
+def highpass_sos(freq, df, corners=4):
+    """
+    Returns second-order sections of Butterworth high-pass filter, same as obspy.signal.filter.highpass uses
+    :param freq:    float   - filter corner frequency
+    :param df:      float   - sampling rate
+    :param corners: int     - filter corners (order), default: 4 (ObsPy default)
+    :return: numpy.ndarray  - filter second-order sections
+    """
+    fe = 0.5 * df
+    f = freq / fe
+    if f > 1:
+        raise ValueError("Selected corner frequency is above Nyquist.")
+
+    z, p, k = iirfilter(corners, f, btype='highpass', ftype='butter', output='zpk')
+    return zpk2sos(z, p, k)
+
+
+def resampling_factors(df, required_df):
+    """
+    Returns rational resampling factors
+    :param df:          float   - input sampling rate
+    :param required_df: float   - output sampling rate
+    :return: (int, int)         - (up, down) factors: required_df / df = up / down
+    """
+    ratio = Fraction(float(required_df) / float(df)).limit_denominator(1000)
+    return ratio.numerator, ratio.denominator
+
+
+@lru_cache(maxsize=None)
+def resampling_filter(up, down):
+    """
+    Returns anti-aliasing FIR filter for polyphase resampling, same as scipy.signal.resample_poly designs by default
+    :param up:   int    - upsampling factor
+    :param down: int    - downsampling factor
+    :return: numpy.ndarray  - filter coefficients
+    """
+    max_rate = max(up, down)
+    return firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+
+
+def resample_batch(data, df, required_df=None):
+    """
+    Resamples a batch of equal length traces with polyphase filtering, filter design is cached per rates pair.
+    Amount of output samples is the same as ObsPy resample produces
+    :param data:        numpy.ndarray   - (..., samples) traces data
+    :param df:          float           - input sampling rate
+    :param required_df: float           - output sampling rate, default: config.required_df
+    :return: numpy.ndarray              - resampled float64 traces data
+    """
+    if required_df is None:
+        required_df = config.required_df
+
+    data = np.asarray(data, dtype=np.float64)
+    if df == required_df:
+        return data
+
+    up, down = resampling_factors(df, required_df)
+    samples = int(data.shape[-1] / (float(df) / required_df))
+    resampled = resample_poly(data, up, down, axis=-1, window=resampling_filter(up, down))
+
+    return resampled[..., :samples]
+
+
+def offset_samples(df):
+    """
+    Returns amount of samples cut from each side of a pick slice (see hdf5_composer.process slice offset)
+    :param df: float    - sampling rate
+    :return: int
+    """
+    offset = (config.slice_duration - config.slice_size) / 2
+    return int(round(offset * df))
+
+
+def process_batch(data, is_acc, noise=False, df=None):
+    """
+    Processes a batch of equal length traces at once. Performs same steps as hdf5_composer.process after
+    resampling: detrend, acceleration to velocity integration, high-pass filtering, slice offset, normalization
+    and resize
+    :param data:   numpy.ndarray   - (batch, channels, samples) or (batch, samples) traces data
+    :param is_acc: numpy.ndarray   - boolean mask of accelerogramms rows, same shape as data without the last axis
+    :param noise:  bool            - True if traces are noise picks (no slice offset applied)
+    :param df:     float           - sampling rate of traces, default: config.required_df
+    :return: numpy.ndarray         - processed float64 traces data of shape (..., samples after slicing)
+    """
+    if df is None:
+        df = config.required_df
+
+    shape = data.shape
+    data = np.array(data, dtype=np.float64).reshape(-1, shape[-1])
+    is_acc = np.asarray(is_acc, dtype=bool).reshape(-1)
+
+    # Detrend
+    if config.detrend:
+        data = detrend(data, axis=-1, type='linear')
+
+    # Acceleration to velocity
+    if is_acc.any():
+        data[is_acc] = cumulative_trapezoid(data[is_acc], dx=1.0 / df, initial=0, axis=-1)
+
+    # High-pass filtering
+    if config.highpass_filter_df > 1:
+        data = sosfilt(highpass_sos(float(config.highpass_filter_df), float(df)), data, axis=-1)
+
+    # Slice offset
+    if not noise:
+        offset = offset_samples(df)
+        if offset > 0:
+            data = data[:, offset:data.shape[1] - offset]
+
+    # Normalize (every trace by its own maximum, traces with zero maximum are kept as is)
+    if config.normalization_enabled:
+        norm = np.abs(data).max(axis=-1, initial=0.0)
+        norm[norm == 0] = 1.0
+        data = data / norm[:, np.newaxis]
+
+    # Check that size is accurate
+    data = data[:, :config.required_trace_length]
+
+    return data.reshape(shape[:-1] + (data.shape[-1],))
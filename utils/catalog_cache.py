@@ -0,0 +1,236 @@
+import os
+import sqlite3
+import logging
+from obspy.core.utcdatetime import UTCDateTime
+
+import utils.nordic_parser as nordic
+import config.vars as config
+
+
+schema_version = 1  # Increase when tables layout changes, forces cache rebuild
+
+schema = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, valid INTEGER);
+CREATE TABLE IF NOT EXISTS events (path TEXT, event_index INTEGER, event_id TEXT, time REAL, magnitude REAL,
+                                   depth REAL);
+CREATE TABLE IF NOT EXISTS picks (path TEXT, event_index INTEGER, pick_index INTEGER, station TEXT, channel TEXT,
+                                  phase_hint TEXT, time REAL, seconds REAL, distance REAL);
+CREATE INDEX IF NOT EXISTS events_path ON events (path);
+CREATE INDEX IF NOT EXISTS picks_path ON picks (path);
+"""
+
+
+class Catalog:
+    """
+    Persistent cache of parsed S-files (see utils/nordic_parser.py). Every S-file is stored with its modification
+    time and size, so only new or changed files are parsed again
+    """
+    commit_interval = 1000  # Amount of updated files after which changes are committed
+
+    def __init__(self, path, output_level=0):
+        """
+        Opens (or creates) catalog cache database
+        :param path:         string     path to cache database file
+        :param output_level: int        0 - min output, 5 - max output, default - 0
+        """
+        self.path = path
+        self.output_level = output_level
+        self.parsed = 0  # Files parsed during this run
+        self.cached = 0  # Files loaded from cache during this run
+        self.uncommitted = 0
+
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(schema)
+
+        # Drop cache if it was built with another layout or parsing options
+        options = '{};{}'.format(schema_version, config.seconds_high_precision)
+        row = self.connection.execute("SELECT value FROM meta WHERE name = 'options'").fetchone()
+        if row is None or row[0] != options:
+            if row is not None and output_level >= 2:
+                logging.warning('Catalog cache ' + path + ' was built with different options, rebuilding')
+            self.clear()
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('options', ?)", (options,))
+            self.connection.commit()
+
+        # Files stats: {path: (mtime, size, valid)}
+        self.files = {}
+        for x in self.connection.execute('SELECT path, mtime, size, valid FROM files'):
+            self.files[x[0]] = (x[1], x[2], x[3])
+
+    def clear(self):
+        """
+        Removes all cached data
+        """
+        self.connection.execute('DELETE FROM files')
+        self.connection.execute('DELETE FROM events')
+        self.connection.execute('DELETE FROM picks')
+        self.files = {}
+
+    def get_events(self, reading_path):
+        """
+        Returns parsed S-file events, parses S-file only if it is not cached or was changed since caching
+        :param reading_path: string     path to S-file
+        :return: [NordicEvent]          - list of events
+                 -1                     - error
+        """
+        try:
+            stat = os.stat(reading_path)
+        except OSError as error:
+            if self.output_level >= 2:
+                logging.warning('In ' + reading_path + ': ' + str(error))
+            return -1
+
+        if self.is_cached(reading_path, stat):
+            self.cached += 1
+            if not self.files[reading_path][2]:
+                return -1
+            return self.load(reading_path)
+
+        events = nordic.read_events(reading_path, self.output_level)
+        self.parsed += 1
+        self.store(reading_path, stat, events)
+        return events
+
+    def is_cached(self, reading_path, stat):
+        """
+        Checks if S-file is cached and was not changed since caching
+        :param reading_path: string         path to S-file
+        :param stat:         os.stat_result S-file stats
+        :return: bool
+        """
+        cached = self.files.get(reading_path)
+        return cached is not None and cached[0] == stat.st_mtime and cached[1] == stat.st_size
+
+    def get_station_counts(self, reading_paths):
+        """
+        Returns amount of picks of every station in S-files. Only new or changed S-files are parsed, picks of
+        cached files are counted by the database without loading them
+        :param reading_paths: [string]  paths to S-files
+        :return: {string: int}          - {station: amount of picks}
+        """
+        selected = []
+        for reading_path in reading_paths:
+            try:
+                stat = os.stat(reading_path)
+            except OSError as error:
+                if self.output_level >= 2:
+                    logging.warning('In ' + reading_path + ': ' + str(error))
+                continue
+
+            if self.is_cached(reading_path, stat):
+                self.cached += 1
+            else:
+                self.store(reading_path, stat, nordic.read_events(reading_path, self.output_level))
+                self.parsed += 1
+
+            if self.files[reading_path][2]:
+                selected.append((reading_path,))
+
+        self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS selected (path TEXT PRIMARY KEY)')
+        self.connection.execute('DELETE FROM selected')
+        self.connection.executemany('INSERT OR IGNORE INTO selected VALUES (?)', selected)
+
+        counts = {}
+        for x in self.connection.execute('SELECT picks.station, COUNT(*) FROM picks '
+                                         'JOIN selected ON picks.path = selected.path GROUP BY picks.station'):
+            counts[x[0]] = x[1]
+        return counts
+
+    def load(self, reading_path):
+        """
+        Loads S-file events from cache
+        :param reading_path: string     path to S-file
+        :return: [NordicEvent]
+        """
+        picks = {}
+        for x in self.connection.execute('SELECT event_index, station, channel, phase_hint, time, seconds, distance '
+                                         'FROM picks WHERE path = ? ORDER BY event_index, pick_index',
+                                         (reading_path,)):
+            if x[0] not in picks:
+                picks[x[0]] = []
+            picks[x[0]].append(nordic.NordicPick(x[1], x[2], x[3], UTCDateTime(x[4]), x[5], x[6]))
+
+        events = []
+        for x in self.connection.execute('SELECT event_index, event_id, time, magnitude, depth '
+                                         'FROM events WHERE path = ? ORDER BY event_index', (reading_path,)):
+            time = None if x[2] is None else UTCDateTime(x[2])
+            events.append(nordic.NordicEvent(x[1], reading_path, time, x[3], x[4], picks.get(x[0], [])))
+
+        return events
+
+    def store(self, reading_path, stat, events):
+        """
+        Stores S-file events in cache
+        :param reading_path: string         path to S-file
+        :param stat:         os.stat_result S-file stats
+        :param events:       [NordicEvent]  list of events or -1 if file is corrupted
+        """
+        valid = events != -1
+        self.connection.execute('DELETE FROM events WHERE path = ?', (reading_path,))
+        self.connection.execute('DELETE FROM picks WHERE path = ?', (reading_path,))
+        self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                (reading_path, stat.st_mtime, stat.st_size, int(valid)))
+        self.files[reading_path] = (stat.st_mtime, stat.st_size, int(valid))
+
+        if valid:
+            event_rows = []
+            pick_rows = []
+            for event_index, event in enumerate(events):
+                time = None if event.time is None else event.time.timestamp
+                event_rows.append((reading_path, event_index, event.event_id, time, event.magnitude, event.depth))
+                for pick_index, pick in enumerate(event.picks):
+                    pick_rows.append((reading_path, event_index, pick_index, pick.station, pick.channel,
+                                      pick.phase_hint, pick.time.timestamp, pick.seconds, pick.distance))
+
+            self.connection.executemany('INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)', event_rows)
+            self.connection.executemany('INSERT INTO picks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', pick_rows)
+
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        """
+        Commits cache changes to the disk
+        """
+        self.connection.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        """
+        Commits changes and closes cache database
+        """
+        self.commit()
+        self.connection.close()
+        if self.output_level >= 3:
+            logging.info('Catalog cache: {} files parsed, {} files loaded from cache'.format(self.parsed,
+                                                                                             self.cached))
+
+
+def open_catalog(output_level=0):
+    """
+    Opens catalog cache specified in config/vars.py
+    :param output_level: int    0 - min output, 5 - max output, default - 0
+    :return: Catalog
+             None               - if catalog cache is disabled
+    """
+    if not config.use_catalog_cache or len(config.catalog_cache_path) == 0:
+        return None
+
+    return Catalog(config.catalog_cache_path, output_level)
+
+
+def read_events(reading_path, catalog=None, output_level=0):
+    """
+    Returns parsed S-file events using catalog cache if provided
+    :param reading_path: string     path to S-file
+    :param catalog:      Catalog    catalog cache, if None - S-file is parsed directly
+    :param output_level: int        0 - min output, 5 - max output, default - 0
+    :return: [NordicEvent]          - list of events
+             -1                     - error
+    """
+    if catalog is None:
+        return nordic.read_events(reading_path, output_level)
+
+    return catalog.get_events(reading_path)
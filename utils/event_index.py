@@ -0,0 +1,41 @@
+import numpy as np
+
+
+class EventIndex:
+    """
+    Picks times index: maps stations to sorted arrays of their picks timestamps, so presence of a pick near a time
+    interval is checked with binary search instead of scanning all picks
+    """
+
+    def __init__(self, picks):
+        """
+        :param picks: list  - picks in format: [(UTCDateTime pick time, station name)]
+                              (see picks_slicing.get_picks_stations_data)
+        """
+        grouped = {}
+        for time, station in picks:
+            if station not in grouped:
+                grouped[station] = []
+            grouped[station].append(time.timestamp)
+
+        self.stations = {}  # {station: numpy.ndarray of sorted pick timestamps}
+        for station, times in grouped.items():
+            self.stations[station] = np.sort(np.array(times, dtype=np.float64))
+
+    def __len__(self):
+        return sum(len(x) for x in self.stations.values())
+
+    def intersects(self, station, start_time, end_time, tolerance=0):
+        """
+        Checks if there is any station pick within the time interval extended by tolerance
+        :param station:    string       - station name
+        :param start_time: UTCDateTime  - interval start
+        :param end_time:   UTCDateTime  - interval end
+        :param tolerance:  float        - seconds added to both sides of the interval, default: 0
+        :return:           bool
+        """
+        if station not in self.stations:
+            return False
+        times = self.stations[station]
+        index = np.searchsorted(times, start_time.timestamp - tolerance, side='left')
+        return bool(index < len(times) and times[index] <= end_time.timestamp + tolerance)
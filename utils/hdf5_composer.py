@@ -1,6 +1,9 @@
-from obspy.core import read
+import numpy as np
+from utils.records import ProcessedSlice
+import utils.hdf5_writer as hdf5_writer
+import utils.pick_archive as pick_archive
+import utils.batch_processing as batch_processing
 import config.vars as config
-import h5py
 import re
 
 
@@ -8,92 +11,29 @@ def compose(filename, p_picks, s_picks, noise_picks):
     """
     Composes an hdf5 file from processed data
     :param filename:    string - full name of resulting hdf5 file
-    :param p_picks:     list   - list of processes p-wave picks
-    :param s_picks:     list   - list of processes s-wave picks
-    :param noise_picks: list   - list of processes noise picks
+    :param p_picks:     list   - list of processes p-wave picks: [[ProcessedSlice for every channel]]
+    :param s_picks:     list   - list of processes s-wave picks: [[ProcessedSlice for every channel]]
+    :param noise_picks: list   - list of processes noise picks: [[ProcessedSlice for every channel]]
     :return:
     """
     # Creating datasets
     print('NOISE: ' + str(len(noise_picks)))
     print('P: ' + str(len(p_picks)))
     print('S: ' + str(len(s_picks)))
-    initial_set = []
-
-    X = []
-    Y = []
-    Z = []
-
-    index = 0
-    local_index = 0
-    while local_index < len(p_picks):
-        transposed_list = []
-        inner_index = 0
-        while inner_index < len(p_picks[local_index][0][0]) and \
-                inner_index < len(p_picks[local_index][1][0]) and \
-                inner_index < len(p_picks[local_index][2][0]):
-            transposed_list.append([p_picks[local_index][0][0][inner_index],
-                                    p_picks[local_index][1][0][inner_index],
-                                    p_picks[local_index][2][0][inner_index]])
-            inner_index += 1
-
-        X.append(transposed_list)
-        Y.append(config.p_code)
-        Z.append(p_picks[local_index][0][2])
-        index += 1
-        local_index += 1
-
-    index = 0
-    local_index = 0
-    while local_index < len(s_picks):
-        transposed_list = []
-        inner_index = 0
-        while inner_index < len(s_picks[local_index][0][0]) and \
-                inner_index < len(s_picks[local_index][1][0]) and \
-                inner_index < len(s_picks[local_index][2][0]):
-            transposed_list.append([s_picks[local_index][0][0][inner_index],
-                                    s_picks[local_index][1][0][inner_index],
-                                    s_picks[local_index][2][0][inner_index]])
-            inner_index += 1
-
-        X.append(transposed_list)
-        Y.append(config.s_code)
-        ascii_string = s_picks[local_index][0][1].encode("ascii", "ignore")
-        Z.append(ascii_string)
-        index += 1
-        local_index += 1
-
-    index = 0
-    local_index = 0
-
-    while local_index < len(noise_picks) and local_index < len(s_picks):
-        transposed_list = []
-        inner_index = 0
-        while inner_index < len(noise_picks[local_index][0][0]) and \
-                inner_index < len(noise_picks[local_index][1][0]) and \
-                inner_index < len(noise_picks[local_index][2][0]):
-            transposed_list.append([noise_picks[local_index][0][0][inner_index],
-                                    noise_picks[local_index][1][0][inner_index],
-                                    noise_picks[local_index][2][0][inner_index]])
-            inner_index += 1
-
-        X.append(transposed_list)
-        Y.append(config.noise_code)
-        ascii_string = noise_picks[local_index][0][1].encode("ascii", "ignore")
-        Z.append(ascii_string)
-        index += 1
-        local_index += 1
-
-
-
-    file = h5py.File(filename, "w")
-
-    dset1 = file.create_dataset('X', data=X)
-    dset2 = file.create_dataset('Y', data=Y)
-
-    if config.save_ids:
-        dset3 = file.create_dataset(config.ids_dataset_name, data=Z)
-
-    file.close()
+
+    writer = hdf5_writer.HDF5Writer(filename)
+
+    # P picks are identified by event ID, S and noise picks - by slice file name
+    for pick in p_picks:
+        writer.append(pick, config.p_code, pick[0].event_id)
+    for pick in s_picks:
+        writer.append(pick, config.s_code, pick[0].file_name)
+
+    # Noise picks amount is limited by S picks amount
+    for pick in noise_picks[:len(s_picks)]:
+        writer.append(pick, config.noise_code, pick[0].file_name)
+
+    writer.close()
 
     return None
 
@@ -104,13 +44,40 @@ def process_pick_list(list):
     :param list: List of waveform picks
     :return: List of processed data
     """
+    return [x for x in iterate_pick_list(list)]
+
+
+def iterate_pick_list(list, pool=None):
+    """
+    Processes a list of waveform picks one by one (see process_pick_list)
+    :param list: List of waveform picks
+    :param pool: ProcessingPool - pool to process picks in (see utils/processing_pool.py), if None - picks are
+                                  processed in the calling process
+    :return: generator of processed picks: [ProcessedSlice for every channel]
+    """
+    tasks = pick_list_tasks(list)
+    if pool is None:
+        results = (process_task(x) for x in tasks)
+    else:
+        results = pool.imap(tasks)
+
+    for processed_slices in results:
+        if processed_slices is not None:
+            yield processed_slices
+
+
+def pick_list_tasks(list):
+    """
+    Generates processing tasks for a list of waveform picks (see process_task)
+    :param list: List of waveform picks
+    :return: generator of tasks
+    """
     # Get stats
     pick_phase_hint = list[0]
     all_actual_picks = list[1]
     pick_stats = all_actual_picks[0]
     all_picks = all_actual_picks[1:]
 
-    result_list = []
     # Parse events
     for event in all_picks:
         event_stats = event[0]
@@ -146,7 +113,7 @@ def process_pick_list(list):
                 continue
 
             # Process slices
-            processed_slices = []
+            files = []
             for slice_file in picks_ordered:
                 file_name_split = slice_file.split('/')
                 file_name = file_name_split[len(file_name_split) - 1]
@@ -157,19 +124,105 @@ def process_pick_list(list):
                 if spip in config.acc_codes:
                     is_acc = True
 
-                processed = process(slice_file, group_stats.file_format, noise=False, is_acc=is_acc)
+                files.append((slice_file, {'file_format': group_stats.file_format, 'noise': False,
+                                           'is_acc': is_acc}))
+
+            yield files, group_stats.event_id, False
+
+
+def process_task(task):
+    """
+    Processes all channels files of a single pick, runs inside processing pool worker or in the calling process
+    :param task: ([(string, dict)], object, bool)   - ([(slice file, process keyword arguments)], pick ID,
+                                                      if True - every channel should be exactly
+                                                      config.required_trace_length samples long)
+    :return: [ProcessedSlice]   - processed slices of every channel (with pick ID as event ID)
+             None               - pick should be skipped
+    """
+    return process_tasks([task])[0]
+
 
-                if processed is None:
+def process_tasks(tasks):
+    """
+    Processes a batch of picks tasks (see process_task). If batch processing is enabled, all single trace streams
+    of the batch are resampled (if polyphase resampling is enabled) and processed by utils/batch_processing.py
+    engine at once, grouped by sampling rate and length
+    :param tasks: [task]    - list of tasks
+    :return: [[ProcessedSlice] or None]     - processed picks in tasks order, None for skipped picks
+    """
+    processed = [[None] * len(x[0]) for x in tasks]  # Processed data of every task channel
+    skipped = [False] * len(tasks)
+    loaded_rows = {}  # {(sampling rate, samples): [(task index, channel index, data, is_acc, noise)]}
+
+    for task_index, task in enumerate(tasks):
+        for channel_index, (file, parameters) in enumerate(task[0]):
+            noise = parameters.get('noise', False)
+            loaded = load(file, parameters.get('file_format', 'MSEED'), noise, parameters.get('is_acc', False),
+                          resample_stream=False)
+            if loaded is None:
+                skipped[task_index] = True
+                break
+
+            st, is_acc = loaded
+            df = st[0].stats.sampling_rate
+            if df != config.required_df and not (config.batch_processing and config.polyphase_resampling and
+                                                 len(st) == 1):
+                resample(st, config.required_df)
+                df = config.required_df
+
+            if config.batch_processing and len(st) == 1:
+                key = (df, len(st[0].data))
+                if key not in loaded_rows:
+                    loaded_rows[key] = []
+                loaded_rows[key].append((task_index, channel_index, st[0].data, is_acc, noise))
+            else:
+                processed[task_index][channel_index] = process_stream(st, noise, is_acc)
+
+    # Resample batches of equal rate and length traces, then group traces by resulting length
+    groups = {}  # {(samples, noise): [(task index, channel index, data, is_acc)]}
+    for (df, samples), rows in loaded_rows.items():
+        rows = [x for x in rows if not skipped[x[0]]]
+        if len(rows) == 0:
+            continue
+
+        data = np.empty((len(rows), samples), dtype=np.float64)
+        for index, x in enumerate(rows):
+            data[index] = x[2]
+        data = batch_processing.resample_batch(data, df, config.required_df)
+
+        for index, x in enumerate(rows):
+            key = (data.shape[1], x[4])
+            if key not in groups:
+                groups[key] = []
+            groups[key].append((x[0], x[1], data[index], x[3]))
+
+    for (samples, noise), rows in groups.items():
+        data = np.empty((len(rows), samples), dtype=np.float64)
+        is_acc = np.empty(len(rows), dtype=bool)
+        for index, x in enumerate(rows):
+            data[index] = x[2]
+            is_acc[index] = x[3]
+
+        data = batch_processing.process_batch(data, is_acc, noise)
+        for index, x in enumerate(rows):
+            processed[x[0]][x[1]] = data[index]
+
+    result = []
+    for task_index, (files, pick_id, check_length) in enumerate(tasks):
+        processed_slices = None
+        if not skipped[task_index]:
+            processed_slices = []
+            for (file, parameters), data in zip(files, processed[task_index]):
+                if check_length and len(data) != config.required_trace_length:
                     processed_slices = None
                     break
 
                 # Save pick and filename and event ID
-                processed_slices.append([processed, slice_file, group_stats.event_id])
+                processed_slices.append(ProcessedSlice(data, file, pick_id))
 
-            if processed_slices is not None:
-                result_list.append(processed_slices)
+        result.append(processed_slices)
 
-    return result_list
+    return result
 
 
 def process(filename, file_format="MSEED", rand=0, noise=False, is_acc=False):
@@ -179,7 +232,26 @@ def process(filename, file_format="MSEED", rand=0, noise=False, is_acc=False):
     :param file_format: string - format of the file, default: miniSEED "MSEED"
     :return: list of samples
     """
-    st = read(filename, file_format)
+    loaded = load(filename, file_format, noise, is_acc)
+    if loaded is None:
+        return None
+
+    st, is_acc = loaded
+    return process_stream(st, noise, is_acc)
+
+
+def load(filename, file_format="MSEED", noise=False, is_acc=False, resample_stream=True):
+    """
+    Reads a pick file and resamples it to required sampling rate (first steps of process)
+    :param filename:        string - filename
+    :param file_format:     string - format of the file, default: miniSEED "MSEED"
+    :param noise:           bool   - True if file is a noise pick
+    :param is_acc:          bool   - True if file is an accelerogramm (detected by file name for noise picks)
+    :param resample_stream: bool   - if False, stream is returned with its original sampling rate
+    :return: (obspy.core.stream.Stream, bool)   - resampled stream and accelerogramm flag
+             None                               - pick should be skipped
+    """
+    st = pick_archive.read_slice(filename, file_format)
 
     # Is acceleration based
     if noise:
@@ -195,9 +267,20 @@ def process(filename, file_format="MSEED", rand=0, noise=False, is_acc=False):
     # Resampling
     if st[0].stats.sampling_rate < config.required_df:
         return None
-    if st[0].stats.sampling_rate != config.required_df:
+    if st[0].stats.sampling_rate != config.required_df and resample_stream:
         resample(st, config.required_df)
 
+    return st, is_acc
+
+
+def process_stream(st, noise=False, is_acc=False):
+    """
+    Processes a resampled pick stream with ObsPy (remaining steps of process)
+    :param st:     obspy.core.stream.Stream - resampled stream
+    :param noise:  bool                     - True if stream is a noise pick
+    :param is_acc: bool                     - True if stream is an accelerogramm
+    :return: list of samples
+    """
     # Detrend
     if config.detrend:
         st.detrend(type='linear')
@@ -235,7 +318,13 @@ def resample(stream, df):
     :param df:
     :return:
     """
-    stream.resample(df)
+    if not config.polyphase_resampling:
+        stream.resample(df)
+        return
+
+    for trace in stream:
+        trace.data = batch_processing.resample_batch(trace.data, trace.stats.sampling_rate, df)
+        trace.stats.sampling_rate = df
 
 
 def resize(stream, size):
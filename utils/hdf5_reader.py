@@ -0,0 +1,164 @@
+import numpy as np
+import h5py
+
+import config.vars as config
+
+
+def map_dataset(dataset, filename, mode='r'):
+    """
+    Maps hdf5 dataset data into memory, mapping is possible only for datasets stored contiguously (not chunked, so
+    not compressed and not resizable) with fixed size elements and allocated storage
+    :param dataset:  h5py.Dataset   - dataset
+    :param filename: string         - path to hdf5 file
+    :param mode:     string         - numpy.memmap mode: 'r' - read only, 'r+' - data can be written, default: 'r'
+    :return: numpy.memmap
+             None   - dataset layout does not allow mapping
+    """
+    if dataset.chunks is not None or dataset.dtype.hasobject or h5py.check_dtype(vlen=dataset.dtype) is not None:
+        return None
+    if dataset.size == 0:
+        return None
+
+    offset = dataset.id.get_offset()
+    if offset is None:
+        return None
+
+    return np.memmap(filename, mode=mode, dtype=dataset.dtype, offset=offset, shape=dataset.shape)
+
+
+class HDF5Reader:
+    """
+    Reader of picks hdf5 files (see hdf5_writer.HDF5Writer and hdf5_composer.compose). Contiguous datasets are mapped
+    with numpy.memmap using their offsets in the file, so batches are views of the mapped file without copying and
+    reading through hdf5 library. Other datasets (chunked, compressed or with variable length elements) are read with
+    h5py by blocks of config.hdf5_chunk_size elements
+    """
+
+    def __init__(self, file, use_mapping=None):
+        """
+        :param file:        string or h5py.File - path to hdf5 file or opened file, opened file is not closed by reader
+        :param use_mapping: bool                - if False - datasets are never mapped, default - config.hdf5_memmap
+        """
+        if isinstance(file, h5py.File):
+            self.file = file
+            self.owned = False
+        else:
+            self.file = h5py.File(file, 'r')
+            self.owned = True
+        self.filename = self.file.filename
+        self.use_mapping = config.hdf5_memmap if use_mapping is None else use_mapping
+        self.block_size = max(1, config.hdf5_chunk_size)
+        self.mapped = {}  # {dataset name: numpy.memmap or None}
+
+    def __len__(self):
+        return len(self.file['Y'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def keys(self):
+        return list(self.file.keys())
+
+    def dataset(self, name):
+        """
+        Returns dataset data: mapped array if dataset can be mapped, h5py dataset otherwise
+        :param name: string     - dataset name
+        :return: numpy.memmap or h5py.Dataset
+        """
+        if name not in self.mapped:
+            self.mapped[name] = map_dataset(self.file[name], self.filename) if self.use_mapping else None
+        if self.mapped[name] is not None:
+            return self.mapped[name]
+        return self.file[name]
+
+    def is_mapped(self, name):
+        """
+        :param name: string     - dataset name
+        :return: bool           - True if dataset is mapped
+        """
+        return isinstance(self.dataset(name), np.memmap)
+
+    def batch(self, start, end, name='X'):
+        """
+        Returns elements of a dataset from start to end: for mapped dataset - view of the mapped file, otherwise
+        elements are read into memory
+        :param start: int       - index of first element
+        :param end:   int       - index of last element + 1
+        :param name:  string    - dataset name, default: 'X'
+        :return: numpy.ndarray
+        """
+        return self.dataset(name)[start:end]
+
+    def take(self, indices, name='X'):
+        """
+        Returns elements of a dataset by indices, used for random access to shuffled batches
+        :param indices: [int]   - indices of elements
+        :param name:    string  - dataset name, default: 'X'
+        :return: numpy.ndarray  - copy of elements
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        data = self.dataset(name)
+        if isinstance(data, np.memmap):
+            return np.take(data, indices, axis=0)
+
+        if len(indices) == 0:
+            return np.empty((0,) + data.shape[1:], dtype=data.dtype)
+
+        # Close indices are read as a single block, h5py selection by a list requires increasing unique indices
+        first = indices.min()
+        if indices.max() - first < self.block_size:
+            return data[first:indices.max() + 1][indices - first]
+        unique, inverse = np.unique(indices, return_inverse=True)
+        return data[unique][inverse]
+
+    def batches(self, batch_size, name='X', indices=None):
+        """
+        Iterates over a dataset by batches
+        :param batch_size: int      - amount of elements in a batch
+        :param name:       string   - dataset name, default: 'X'
+        :param indices:    [int]    - if set, batches are taken by these indices (see take), otherwise batches are
+                                      consecutive (see batch)
+        :return: generator of numpy.ndarray
+        """
+        batch_size = max(1, batch_size)
+        if indices is None:
+            length = len(self.dataset(name))
+            for start in range(0, length, batch_size):
+                yield self.batch(start, min(length, start + batch_size), name)
+        else:
+            for start in range(0, len(indices), batch_size):
+                yield self.take(indices[start:start + batch_size], name)
+
+    def label_counts(self, name='Y', limit=-1):
+        """
+        Counts elements of every label, labels are counted by blocks, so labels dataset is never read whole
+        :param name:  string    - labels dataset name, default: 'Y'
+        :param limit: int       - amount of first elements to count, if negative - all elements, default: -1
+        :return: {int: int}     - {label: amount of elements}
+        """
+        data = self.dataset(name)
+        length = len(data) if limit < 0 else min(limit, len(data))
+
+        # Mapped labels are not read through hdf5 library, so they are counted by larger blocks
+        block_size = self.block_size
+        if isinstance(data, np.memmap):
+            block_size = max(block_size, config.hdf5_memmap_block_size)
+
+        counts = {}
+        for start in range(0, length, block_size):
+            labels, label_counts = np.unique(data[start:min(length, start + block_size)], return_counts=True)
+            for label, count in zip(labels.tolist(), label_counts.tolist()):
+                counts[label] = counts.get(label, 0) + count
+
+        return counts
+
+    def close(self):
+        """
+        Releases mapped datasets and closes the file if it was opened by the reader
+        """
+        self.mapped = {}
+        if self.owned:
+            self.file.close()
@@ -0,0 +1,143 @@
+import numpy as np
+import h5py
+
+import config.vars as config
+
+
+class HDF5Writer:
+    """
+    Streaming writer of picks hdf5 file: X, Y and Z datasets are created resizable and chunked, picks are buffered
+    in a batch of chunk size and appended to the datasets, so whole dataset is never held in memory.
+    Datasets layout is the same as of hdf5_composer.compose
+    """
+
+    def __init__(self, filename, chunk_size=None, compression=None, compression_level=None):
+        """
+        Creates hdf5 file and empty datasets
+        :param filename:          string - full name of resulting hdf5 file
+        :param chunk_size:        int    - amount of picks in a chunk (and in a write batch),
+                                           default - config.hdf5_chunk_size
+        :param compression:       string - datasets compression filter: 'gzip', 'lzf' or None,
+                                           default - config.hdf5_compression
+        :param compression_level: int    - gzip compression level, default - config.hdf5_compression_level
+        """
+        if chunk_size is None:
+            chunk_size = config.hdf5_chunk_size
+        if compression is None:
+            compression = config.hdf5_compression
+        if compression_level is None:
+            compression_level = config.hdf5_compression_level
+        if compression != 'gzip':
+            compression_level = None
+
+        self.filename = filename
+        self.chunk_size = max(1, chunk_size)
+        self.length = config.required_trace_length
+        self.size = 0  # Amount of picks written to the file
+        self.counts = {}  # {code: amount of picks}
+
+        # Write batch
+        self.batch_x = np.zeros((self.chunk_size, self.length, 3), dtype=np.float32)
+        self.batch_y = np.empty(self.chunk_size, dtype=np.int64)
+        self.batch_z = []
+        self.batch_size = 0
+
+        self.file = h5py.File(filename, "w")
+        self.X = self.file.create_dataset('X', shape=(0, self.length, 3), maxshape=(None, self.length, 3),
+                                          dtype=np.float32, chunks=(self.chunk_size, self.length, 3),
+                                          compression=compression, compression_opts=compression_level)
+        self.Y = self.file.create_dataset('Y', shape=(0,), maxshape=(None,), dtype=np.int64,
+                                          chunks=(self.chunk_size,), compression=compression,
+                                          compression_opts=compression_level)
+        self.Z = None
+        if config.save_ids:
+            self.Z = self.file.create_dataset(config.ids_dataset_name, shape=(0,), maxshape=(None,),
+                                              dtype=h5py.special_dtype(vlen=bytes), chunks=(self.chunk_size,),
+                                              compression=compression, compression_opts=compression_level)
+
+    def append(self, pick, code, pick_id):
+        """
+        Appends a pick to the file
+        :param pick:    [ProcessedSlice]    - processed slices of every channel
+        :param code:    int                 - Y code of the pick (config.p_code, config.s_code or config.noise_code)
+        :param pick_id: string              - pick ID saved in Z dataset
+        """
+        row = self.batch_x[self.batch_size]
+        row[:] = 0
+        stack_channels(pick, row)
+        self.batch_y[self.batch_size] = code
+        self.batch_z.append(str(pick_id).encode("ascii", "ignore"))
+        self.batch_size += 1
+        self.counts[code] = self.counts.get(code, 0) + 1
+
+        if self.batch_size == self.chunk_size:
+            self.flush()
+
+    def copy(self, start, end, code):
+        """
+        Appends copies of already written picks with another Y code. Picks are copied chunk by chunk
+        :param start: int   - index of first copied pick
+        :param end:   int   - index of last copied pick + 1
+        :param code:  int   - Y code of copies
+        """
+        self.flush()
+        for index in range(start, end, self.chunk_size):
+            last = min(end, index + self.chunk_size)
+            self.write(self.X[index:last], np.full(last - index, code, dtype=np.int64),
+                       list(self.Z[index:last]) if self.Z is not None else None)
+            self.counts[code] = self.counts.get(code, 0) + last - index
+
+    def count(self, code):
+        """
+        :param code: int    - Y code
+        :return: int        - amount of appended picks with the code
+        """
+        return self.counts.get(code, 0)
+
+    def flush(self):
+        """
+        Writes buffered picks to the file
+        """
+        if self.batch_size == 0:
+            return
+        self.write(self.batch_x[:self.batch_size], self.batch_y[:self.batch_size], self.batch_z)
+        self.batch_z = []
+        self.batch_size = 0
+
+    def write(self, x, y, z):
+        """
+        Appends arrays to the datasets
+        :param x: numpy.ndarray - (n, required_trace_length, 3) data
+        :param y: numpy.ndarray - (n) codes
+        :param z: [bytes]       - picks IDs
+        """
+        start = self.size
+        self.size += len(y)
+        self.X.resize(self.size, axis=0)
+        self.Y.resize(self.size, axis=0)
+        self.X[start:self.size] = x
+        self.Y[start:self.size] = y
+        if self.Z is not None:
+            self.Z.resize(self.size, axis=0)
+            self.Z[start:self.size] = z
+
+    def close(self):
+        """
+        Writes remaining picks and closes the file
+        """
+        self.flush()
+        self.file.close()
+        print('P: {}, S: {}, NOISE: {}'.format(self.count(config.p_code), self.count(config.s_code),
+                                               self.count(config.noise_code)))
+
+
+def stack_channels(pick, row):
+    """
+    Writes channels of a processed pick into a row of X dataset as columns, data is cut to the shortest channel,
+    remaining samples stay zero
+    :param pick: [ProcessedSlice]   - processed slices of every channel
+    :param row:  numpy.ndarray      - (required_trace_length, channels) X dataset row
+    """
+    length = min(row.shape[0], min(len(x.data) for x in pick[:row.shape[1]]))
+    for channel, x in enumerate(pick[:row.shape[1]]):
+        row[:length, channel] = x.data[:length]
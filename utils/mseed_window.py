@@ -0,0 +1,355 @@
+import io
+import os
+import struct
+import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+import obspy.core
+from obspy.io.mseed.core import _read_mseed as read_mseed
+
+import config.vars as config
+
+
+header_length = 48  # Length of miniSEED fixed section of data header
+index_block_size = 1024 * 1024  # Size of blocks in which file is read while indexing records
+epoch_ordinal = datetime.date(1970, 1, 1).toordinal()
+
+
+class RecordIndex:
+    """
+    Start and end times of every record of a fixed record length miniSEED file
+    """
+
+    def __init__(self, record_length, starts, ends, padding=0.):
+        """
+        :param record_length: int           length of every record in bytes
+        :param starts:        array('d')    records start timestamps, infinity for records without samples
+        :param ends:          array('d')    records end timestamps (time of the last sample), minus infinity for
+                                            records without samples
+        :param padding:       float         seconds added to both sides of interval when records are not ordered:
+                                            longest record duration plus its sample period, default: 0
+        """
+        self.record_length = record_length
+        self.starts = starts
+        self.ends = ends
+        self.padding = padding
+        self.ordered = True
+        for i in range(len(starts)):
+            if starts[i] == float('inf') or (i > 0 and starts[i] < starts[i - 1]):
+                self.ordered = False
+                break
+
+        # Records positions sorted by start time and their start times, used if records are not ordered
+        self.order = None
+        self.sorted_starts = None
+        if not self.ordered:
+            self.order = sorted(range(len(starts)), key=lambda x: starts[x])
+            self.sorted_starts = [starts[x] for x in self.order]
+
+    def records(self, start_time, end_time):
+        """
+        Returns range of records which cover provided time interval. Selection is padded by one record on both
+        sides (or by index padding if records are not ordered), so decoded traces extend past both interval edges
+        even if an edge is in the gap between the last sample of a record and the first sample of the next one
+        :param start_time: float    interval start timestamp
+        :param end_time:   float    interval end timestamp
+        :return: (int, int)         - (first record, last record + 1)
+                 None               - if no record overlaps the interval
+        """
+        first = None
+        last = None
+        if self.ordered:
+            index = max(bisect_right(self.starts, start_time) - 1, 0)
+            while index < len(self.starts) and self.starts[index] <= end_time:
+                if self.ends[index] >= start_time:
+                    if first is None:
+                        first = index
+                    last = index
+                index += 1
+
+            if first is None:
+                # Interval is inside a gap between records, padding may still cover it
+                index = bisect_right(self.starts, start_time)
+                if 0 < index < len(self.starts):
+                    first = index - 1
+                    last = index
+                else:
+                    return None
+
+            return max(first - 1, 0), min(last + 2, len(self.starts))
+
+        # Record which ends after padded interval start begins not earlier than padding before it
+        start_time -= self.padding
+        end_time += self.padding
+        index = bisect_left(self.sorted_starts, start_time - self.padding)
+        while index < len(self.sorted_starts) and self.sorted_starts[index] <= end_time:
+            position = self.order[index]
+            if self.ends[position] >= start_time:
+                first = position if first is None else min(first, position)
+                last = position if last is None else max(last, position)
+            index += 1
+
+        if first is None:
+            return None
+
+        return first, last + 1
+
+
+def record_length(header, byte_order):
+    """
+    Gets record length from blockette 1000
+    :param header:     bytes    record header (with blockettes)
+    :param byte_order: string   struct byte order character
+    :return: int    - record length
+             None   - no blockette 1000 found
+    """
+    offset = struct.unpack(byte_order + 'H', header[46:48])[0]
+    while 0 < offset and offset + 8 <= len(header):
+        blockette_type, next_offset = struct.unpack(byte_order + 'HH', header[offset:offset + 4])
+        if blockette_type == 1000:
+            return 2 ** header[offset + 6]
+        if next_offset <= offset:
+            break
+        offset = next_offset
+    return None
+
+
+def header_byte_order(header):
+    """
+    Detects byte order of the record header by its start time
+    :param header: bytes    record header
+    :return: string - struct byte order character
+             None   - not a miniSEED header
+    """
+    if header[6:7] not in (b'D', b'R', b'Q', b'M'):
+        return None
+
+    for byte_order in ('>', '<'):
+        year, day = struct.unpack(byte_order + 'HH', header[20:24])
+        if 1900 <= year <= 2100 and 1 <= day <= 366:
+            return byte_order
+
+    return None
+
+
+def record_times(header, byte_order):
+    """
+    Calculates record start and end timestamps
+    :param header:     bytes    record header (with blockettes)
+    :param byte_order: string   struct byte order character
+    :return: (float, float, float)  - start and end (last sample) timestamps and sample period (0 if sample rate
+                                      is unknown)
+             None                   - record has no samples
+    """
+    year, day, hour, minute, second, unused, fraction, samples, factor, multiplier, activity, io_flags, quality, \
+        blockettes, correction = struct.unpack(byte_order + 'HHBBBBHHhhBBBBi', header[20:44])
+
+    if samples == 0:
+        return None
+
+    # Sample rate (blockette 100 overrides nominal one)
+    rate = 0.0
+    if factor > 0 and multiplier > 0:
+        rate = float(factor * multiplier)
+    elif factor > 0 > multiplier:
+        rate = -float(factor) / multiplier
+    elif factor < 0 < multiplier:
+        rate = -float(multiplier) / factor
+    elif factor < 0 and multiplier < 0:
+        rate = 1.0 / (factor * multiplier)
+
+    offset = struct.unpack(byte_order + 'H', header[46:48])[0]
+    while 0 < offset and offset + 8 <= len(header):
+        blockette_type, next_offset = struct.unpack(byte_order + 'HH', header[offset:offset + 4])
+        if blockette_type == 100:
+            rate = struct.unpack(byte_order + 'f', header[offset + 4:offset + 8])[0]
+        if next_offset <= offset:
+            break
+        offset = next_offset
+
+    start = (datetime.date(year, 1, 1).toordinal() - epoch_ordinal + day - 1) * 86400.0
+    start += hour * 3600 + minute * 60 + second + fraction * 0.0001
+    if not activity & 0x02:
+        start += correction * 0.0001
+
+    end = start
+    period = 0.
+    if rate > 0:
+        end += (samples - 1) / rate
+        period = 1. / rate
+
+    return start, end, period
+
+
+def build_index(path):
+    """
+    Reads all records headers of miniSEED file and builds records time index
+    :param path: string     path to miniSEED file
+    :return: RecordIndex
+             None           - file is not a fixed record length miniSEED file or its records are ordered, but
+                              belong to several channels: padding by one record does not reach neighbouring records
+                              of the same channel
+    """
+    with open(path, 'rb') as f:
+        first_header = f.read(256)
+        if len(first_header) < header_length:
+            return None
+
+        byte_order = header_byte_order(first_header)
+        if byte_order is None:
+            return None
+
+        length = record_length(first_header, byte_order)
+        if length is None or length < header_length or index_block_size % length != 0:
+            return None
+
+        starts = array('d')
+        ends = array('d')
+        padding = 0.
+        channels = set()  # Network, station, location and channel codes of records with samples
+        f.seek(0)
+        while True:
+            block = f.read(index_block_size)
+            if len(block) == 0:
+                break
+            if len(block) % length != 0:
+                return None
+
+            for offset in range(0, len(block), length):
+                header = block[offset:offset + min(length, 256)]
+                if header_byte_order(header) != byte_order or record_length(header, byte_order) != length:
+                    return None
+
+                times = record_times(header, byte_order)
+                if times is None:
+                    # Keep record positions, records without samples never overlap any interval
+                    starts.append(float('inf'))
+                    ends.append(float('-inf'))
+                else:
+                    starts.append(times[0])
+                    ends.append(times[1])
+                    padding = max(padding, times[1] - times[0] + times[2])
+                    channels.add(header[8:20])
+
+    index = RecordIndex(length, starts, ends, padding)
+    if index.ordered and len(channels) > 1:
+        return None
+
+    return index
+
+
+class WindowReader:
+    """
+    Reads time windows of miniSEED files decoding only records which overlap the window.
+    Records index is built on the first touch of every file and kept in a bounded LRU cache
+    """
+
+    def __init__(self, max_files):
+        """
+        :param max_files: int   max number of files indexes kept in memory
+        """
+        self.max_files = max_files
+        self.indexes = OrderedDict()  # {path: (mtime, RecordIndex or None)}
+
+    def index(self, path):
+        """
+        Returns records index of the file, builds it if file is not indexed or was changed since indexing
+        :param path: string     path to miniSEED file
+        :return: RecordIndex
+                 None           - file cannot be read by windows
+        """
+        mtime = os.path.getmtime(path)
+        cached = self.indexes.get(path)
+        if cached is not None and cached[0] == mtime:
+            self.indexes.move_to_end(path)
+            return cached[1]
+
+        index = build_index(path)
+        self.indexes[path] = (mtime, index)
+        self.indexes.move_to_end(path)
+        while len(self.indexes) > self.max_files:
+            self.indexes.popitem(last=False)
+
+        return index
+
+    def read(self, path, start_time, end_time):
+        """
+        Reads records of miniSEED file which overlap provided time window. Traces are not trimmed to the window
+        :param path:       string       path to miniSEED file
+        :param start_time: UTCDateTime  window start
+        :param end_time:   UTCDateTime  window end
+        :return: obspy.core.stream.Stream
+                 None                       - file cannot be read by windows (read it as a whole)
+        """
+        index = self.index(path)
+        if index is None:
+            return None
+
+        records = index.records(start_time.timestamp, end_time.timestamp)
+        if records is None:
+            return obspy.core.Stream()
+
+        with open(path, 'rb') as f:
+            f.seek(records[0] * index.record_length)
+            data = f.read((records[1] - records[0]) * index.record_length)
+
+        return read_mseed(io.BytesIO(data))
+
+
+def read_blocks(path, block_size):
+    """
+    Reads fixed record length miniSEED file by blocks of consecutive records. miniSEED plugin is called directly,
+    because generic obspy.core.read resolves format plugins on every call
+    :param path:       string   path to miniSEED file
+    :param block_size: int      approximate size of block in bytes (rounded up to whole records)
+    :return: generator of obspy.core.stream.Stream
+             None       - file is not a fixed record length miniSEED file
+    """
+    with open(path, 'rb') as f:
+        first_header = f.read(256)
+
+    if len(first_header) < header_length:
+        return None
+
+    byte_order = header_byte_order(first_header)
+    if byte_order is None:
+        return None
+
+    length = record_length(first_header, byte_order)
+    if length is None or length < header_length:
+        return None
+
+    records = max(1, -(-block_size // length))
+    return record_blocks(path, records * length)
+
+
+def record_blocks(path, block_size):
+    """
+    Generates streams of consecutive file blocks (see read_blocks)
+    :param path:       string   path to miniSEED file
+    :param block_size: int      size of block in bytes, multiple of record length
+    :return: generator of obspy.core.stream.Stream
+    """
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            if len(data) == 0:
+                break
+            yield read_mseed(io.BytesIO(data))
+
+
+# Reader shared by all archive consumers of the process
+reader = WindowReader(config.mseed_index_cache_files)
+
+
+def read_window(path, start_time, end_time):
+    """
+    Reads time window of miniSEED file through the shared reader
+    :param path:       string       path to miniSEED file
+    :param start_time: UTCDateTime  window start
+    :param end_time:   UTCDateTime  window end
+    :return: obspy.core.stream.Stream
+             None                       - file cannot be read by windows
+    """
+    return reader.read(path, start_time, end_time)
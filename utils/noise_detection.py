@@ -0,0 +1,267 @@
+import logging
+import random
+import numpy as np
+from obspy.signal.trigger import recursive_sta_lta
+
+import utils.seisan_reader as seisan
+import utils.archive_cache as archive_cache
+import utils.archive_files as archive_files
+import utils.mseed_window as mseed_window
+from utils.records import PickSlice
+import config.vars as config
+
+
+def warmup_samples(nlta):
+    """
+    Returns amount of preceding samples which is enough to restore recursive STA/LTA filters state: contribution of
+    older samples to the filters is below float64 precision
+    :param nlta: int    - length of long time average window in samples
+    :return: int
+    """
+    if nlta <= 1:
+        return 1
+    return int(np.ceil(np.log(np.finfo(np.float64).eps) / np.log1p(-1. / nlta)))
+
+
+def onsets(data, df, history=None, armed=True):
+    """
+    Finds STA/LTA trigger onsets of trace data, same as onsets of obspy.signal.trigger.trigger_onset of obspy version
+    from requirements.txt applied to obspy.signal.trigger.recursive_sta_lta characteristic function: trigger turns on
+    when characteristic function rises strictly above config.noise_trigger_on and can turn on again only after it
+    falls to config.noise_trigger_off or below
+    :param data:    numpy.ndarray   - trace data
+    :param df:      float           - sampling rate
+    :param history: numpy.ndarray   - preceding samples of the same continuous trace, if trace is processed by
+                                      consecutive blocks (see warmup_samples)
+    :param armed:   bool            - False if trigger was on at the end of preceding samples, default - True
+    :return: (numpy.ndarray, bool)  - indices of onset samples of data and if trigger can turn on after data
+    """
+    if history is not None and len(history) > 0:
+        data = np.concatenate((history, data))
+        offset = len(history)
+    else:
+        offset = 0
+
+    nlta = int(config.noise_lta * df)
+    cft = recursive_sta_lta(data, int(config.noise_sta * df), nlta)
+    # First LTA window is zeroed by obspy only if data is longer than it, so short first blocks are zeroed here
+    cft[:nlta] = 0.
+    cft = cft[offset:]
+    above = np.flatnonzero(cft > config.noise_trigger_on)
+    below = np.flatnonzero(cft <= config.noise_trigger_off)
+
+    result = []
+    position = 0
+    while True:
+        if not armed:
+            i = np.searchsorted(below, position)
+            if i == len(below):
+                break
+            position = below[i]
+            armed = True
+        i = np.searchsorted(above, position)
+        if i == len(above):
+            break
+        position = above[i]
+        result.append(position)
+        armed = False
+
+    return np.array(result, dtype=np.int64), armed
+
+
+def add_onsets(triggers, trace, first_sample, samples, date, windows):
+    """
+    Adds first onset of every day window to triggers
+    :param triggers:     dict           - {window: (trace, onset sample)}, windows already in triggers are kept
+    :param trace:        Trace          - first trace of continuous segment, onset samples are counted from it
+    :param first_sample: int            - index of the first sample of checked data in the segment
+    :param samples:      numpy.ndarray  - indices of onsets in checked data (see onsets)
+    :param date:         UTCDateTime    - day
+    :param windows:      int            - amount of equal windows the day is split into
+    """
+    if len(samples) == 0:
+        return
+    seconds = (trace.stats.starttime - date) + (samples + first_sample) / float(trace.stats.sampling_rate)
+    indices = np.floor(seconds / (86400. / windows)).astype(np.int64)
+    for window, sample in zip(indices.tolist(), samples.tolist()):
+        if 0 <= window < windows and window not in triggers:
+            triggers[window] = (trace, first_sample + sample)
+
+
+def stream_triggers(stream, date, windows):
+    """
+    Finds first STA/LTA trigger onset of every day window of a stream, traces are checked in order
+    :param stream:  obspy.core.stream.Stream
+    :param date:    UTCDateTime     - day
+    :param windows: int             - amount of equal windows the day is split into
+    :return: {int: (obspy.core.trace.Trace, int)}   - {window: (triggered trace, trigger onset sample)}
+    """
+    triggers = {}
+    for trace in stream:
+        if len(trace.data) == 0:
+            continue
+        add_onsets(triggers, trace, 0, onsets(trace.data, trace.stats.sampling_rate)[0], date, windows)
+    return triggers
+
+
+def archive_triggers(archive_file_path, date, windows):
+    """
+    Finds first STA/LTA trigger onset of every window of a day archive. Fixed record length single channel archives
+    are decoded progressively by blocks of config.noise_block_bytes, other archives are read as a whole
+    :param archive_file_path: string        - path to day archive
+    :param date:              UTCDateTime   - day
+    :param windows:           int           - amount of equal windows the day is split into
+    :return: {int: (obspy.core.trace.Trace, int)}   - {window: (triggered trace, trigger onset sample)}, trace is
+                                                      the first decoded block of a trace for progressively decoded
+                                                      archives
+    """
+    blocks = None
+    if config.windowed_archive_reads:
+        blocks = mseed_window.read_blocks(archive_file_path, config.noise_block_bytes)
+    if blocks is None:
+        return stream_triggers(archive_cache.read(archive_file_path), date, windows)
+
+    # Current continuous trace: [first block trace, end timestamp, amount of samples, last samples, trigger armed]
+    segment = None
+    triggers = {}
+    for stream in blocks:
+        for trace in stream:
+            df = trace.stats.sampling_rate
+            if len(trace.data) == 0 or df <= 0:
+                continue
+
+            if segment is not None:
+                # Interleaved channels or unordered records: traces would be merged differently by a whole read
+                if segment[0].id != trace.id or trace.stats.starttime.timestamp <= segment[1]:
+                    return stream_triggers(archive_cache.read(archive_file_path), date, windows)
+
+            if segment is None or segment[0].stats.sampling_rate != df or \
+                    abs(trace.stats.starttime.timestamp - segment[1] - 1. / df) > 0.5 / df:
+                segment = [trace, None, 0, None, True]
+
+            samples, segment[4] = onsets(trace.data, df, segment[3], segment[4])
+            add_onsets(triggers, segment[0], segment[2], samples, date, windows)
+            if len(triggers) == windows:
+                return triggers
+
+            # Keep samples needed to continue STA/LTA computation on the next block
+            history = trace.data if segment[3] is None else np.concatenate((segment[3], trace.data))
+            segment[1] = trace.stats.endtime.timestamp
+            segment[2] += len(trace.data)
+            segment[3] = history[-warmup_samples(int(config.noise_lta * df)):]
+
+    return triggers
+
+
+def day_archives(station_archives, date, output_level=0):
+    """
+    Returns existing day archives of a station
+    :param station_archives: [ArchiveDefinition]    - station archives definitions
+    :param date:             UTCDateTime            - day
+    :param output_level:     int                    - 0 - min output, 5 - max output, default - 0
+    :return: [(ArchiveDefinition, string)]  - archive definitions with paths to day archives
+    """
+    archives = []
+    for x in station_archives:
+        archive_file_path = seisan.archive_path(x, date.year, date.julday, config.archives_path, output_level)
+        if archive_files.exists(archive_file_path):
+            archives.append((x, archive_file_path))
+    return archives
+
+
+def find_intervals(archives, date, events=None, rng=None, output_level=0):
+    """
+    Finds noise slice intervals of a station day: day is split into config.noise_day_windows equal windows, first
+    STA/LTA trigger onset of every window defines its interval (see archive_triggers). Archives are checked in order,
+    next archive is checked only for windows without an interval. Intervals which have station picks closer than
+    config.event_tolerance seconds are rejected
+    :param archives:     [(ArchiveDefinition, string)]  - day archives (see day_archives)
+    :param date:         UTCDateTime                    - day
+    :param events:       EventIndex                     - picks times index, if None - intervals are not checked
+    :param rng:          function                       - returns random generator for slice time shifts of a
+                                                          window, default - random module generator
+    :param output_level: int                            - 0 - min output, 5 - max output, default - 0
+    :return: [(int, UTCDateTime)]   - windows and their noise slices start times sorted by window
+    """
+    windows = max(1, config.noise_day_windows)
+    intervals = {}  # {window: start time}
+    for x, archive_file_path in archives:
+        if len(intervals) == windows:
+            break
+
+        try:
+            triggers = archive_triggers(archive_file_path, date, windows)
+        except TypeError as error:
+            if output_level >= 2:
+                logging.warning('In ' + archive_file_path + ': ' + str(error))
+            continue
+
+        for window in sorted(triggers):
+            if window in intervals:
+                continue
+            trace, onset = triggers[window]
+
+            window_rng = rng(window) if rng is not None else random
+            if config.slice_offset_start == config.slice_offset_end:
+                time_shift = config.slice_offset_start
+            else:
+                time_shift = window_rng.randrange(config.slice_offset_start, config.slice_offset_end)
+
+            # Calculate trigger time
+            seconds_passed = float(onset) * float(1.0 / float(trace.stats.sampling_rate))
+            start_slice_time = trace.stats.starttime + int(seconds_passed)
+            start_time = start_slice_time - config.static_slice_offset - time_shift
+
+            if events is not None and events.intersects(x.station, start_time, start_time + config.slice_duration,
+                                                        config.event_tolerance):
+                if output_level >= 3:
+                    print('rejected noise interval near event: ' + str(start_time))
+                continue
+
+            if output_level >= 4:
+                print('main trace: ' + str(trace))
+            intervals[window] = start_time
+
+    return sorted(intervals.items())
+
+
+def cut_slices(archives, date, start_time, output_level=0):
+    """
+    Cuts noise slices from day archives, archives are read through archive cache: only records overlapping the slice
+    interval are decoded (see archive_cache.read_window)
+    :param archives:     [(ArchiveDefinition, string)]  - day archives (see day_archives)
+    :param date:         UTCDateTime                    - day
+    :param start_time:   UTCDateTime                    - slice start time
+    :param output_level: int                            - 0 - min output, 5 - max output, default - 0
+    :return: [PickSlice]    - noise slices
+    """
+    end_time = start_time + config.slice_duration
+
+    slices = []
+    for x, archive_file_path in archives:
+        try:
+            stream = archive_cache.read_window(archive_file_path, start_time, end_time)
+        except TypeError as error:
+            if output_level >= 2:
+                logging.warning('In ' + archive_file_path + ': ' + str(error))
+            continue
+
+        for trace in stream:
+            trace_slice = trace.slice(start_time, end_time)
+            if len(trace_slice.data) < 400:
+                continue
+
+            # Start time is added, because a station day may have several noise intervals
+            interval = start_time.strftime('%H%M%S')
+            trace_file = x.station + str(date.year) + str(date.julday) + interval + x.channel + x.subdir + \
+                x.location + '.NOISE'
+            slice_id = x.station + str(date.year) + str(date.julday) + interval + x.subdir + x.location
+            slices.append(PickSlice(trace_slice, trace_file, x.station, x.channel, slice_id, 'N', None))
+
+            if output_level >= 4:
+                print('trace: ' + str(trace))
+                print('slice: ' + str(len(trace_slice.data)) + ' start: ' + str(start_time) + ' end: ' +
+                      str(end_time))
+
+    return slices
+
@@ -0,0 +1,295 @@
+import hashlib
+import heapq
+import multiprocessing
+import random
+from obspy.core.utcdatetime import UTCDateTime
+
+import utils.seisan_reader as seisan
+import utils.picks_slicing as picks
+import utils.noise_detection as noise_detection
+import utils.converter as converter
+import config.vars as config
+
+
+# Archive definitions index and picks times index of the worker process, set by init_worker
+worker_definitions = None
+worker_events = None
+
+
+def init_worker(archive_definitions, events):
+    """
+    Initializes noise picking worker process
+    :param archive_definitions: ArchiveIndex    archive definitions index
+    :param events:              EventIndex      picks times index
+    """
+    global worker_definitions, worker_events
+    worker_definitions = archive_definitions
+    worker_events = events
+
+
+def days_range(start_date, end_date):
+    """
+    Returns days from start date till end date, days are iterated the same way as noise-picker does
+    :param start_date: [int]    - [year, month, day]
+    :param end_date:   [int]    - [year, month, day]
+    :return: [UTCDateTime]
+    """
+    days = []
+    current_date = list(start_date)
+    end_date_utc = converter.utcdatetime_from_tuple(end_date)
+    while True:
+        current_date_utc = converter.utcdatetime_from_tuple(current_date)
+        if current_date_utc > end_date_utc:
+            break
+        days.append(current_date_utc)
+
+        current_date[2] += 1
+        if current_date[2] > config.month_length[current_date[1] - 1]:
+            current_date[2] = 1
+            current_date[1] += 1
+            if current_date[1] > 12:
+                current_date[1] = 1
+                current_date[0] += 1
+
+    return days
+
+
+def candidate_key(seed, station, date, window=0):
+    """
+    Returns sampling key of a station day window: pseudo-random, but defined only by the seed, station, day and
+    window, so sampled candidates do not depend on the order they are found in
+    :param seed:    int         - sampling seed
+    :param station: string      - station name
+    :param date:    UTCDateTime - day
+    :param window:  int         - window of the day (see noise_detection.find_intervals), default - 0
+    :return: int
+    """
+    digest = hashlib.sha1('{}|{}|{}|{}'.format(seed, station, date.date, window).encode()).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def day_candidates(task):
+    """
+    Finds noise slice intervals of all stations for a day, every station day gives up to config.noise_day_windows
+    candidates spread across the day, runs inside worker process (or in the main one if no workers used). Slice time
+    shifts are drawn from generators seeded by the station day window keys
+    :param task: (float, [string], int) - (day timestamp, stations, sampling seed)
+    :return: [(int, (float, string, float))]    - [(key, (day timestamp, station, slice start timestamp))]
+    """
+    timestamp, stations, seed = task
+    date = UTCDateTime(timestamp)
+
+    if config.output_level >= 3:
+        print(str(date))
+
+    candidates = []
+    for station in stations:
+        if not config.tolerate_events_in_same_day and \
+                worker_events.intersects(station, date, date + 86400, config.event_tolerance):
+            continue
+
+        archives = noise_detection.day_archives(seisan.find_station_archives(worker_definitions, station, date), date,
+                                                config.output_level)
+        intervals = noise_detection.find_intervals(archives, date, worker_events,
+                                                   lambda x: random.Random(candidate_key(seed, station, date, x)),
+                                                   config.output_level)
+        for window, start_time in intervals:
+            candidates.append((candidate_key(seed, station, date, window), (timestamp, station, start_time.timestamp)))
+
+    return candidates
+
+
+def save_candidate(task):
+    """
+    Cuts and saves noise slices of a sampled candidate, runs inside worker process (or in the main one if no
+    workers used)
+    :param task: ((float, string, float), string)   - (candidate (see day_candidates), save directory)
+    :return: int    - number of saved slices
+    """
+    (timestamp, station, start_timestamp), save_dir = task
+    date = UTCDateTime(timestamp)
+
+    archives = noise_detection.day_archives(seisan.find_station_archives(worker_definitions, station, date), date,
+                                            config.output_level)
+    slices = noise_detection.cut_slices(archives, date, UTCDateTime(start_timestamp), config.output_level)
+    if len(slices) > 0:
+        if config.output_level >= 3:
+            print('STATION: ' + str(station))
+        picks.save_traces([slices], save_dir)
+
+    return len(slices)
+
+
+class NoiseReservoir:
+    """
+    Stratified bottom-k sample of candidates: every stratum keeps candidates with the smallest keys. Sample is
+    selected so that strata are represented as equally as possible (see items), so a stratum never contributes more
+    than depth candidates, where depth is the smallest one at which strata together have size candidates. Strata are
+    periodically pruned to that depth, which only decreases as candidates are added, so memory is bounded by about
+    size candidates plus one candidate per stratum. Since keys are defined by candidates themselves, the sample does
+    not depend on the order candidates are added in
+    """
+
+    def __init__(self, size, stratum=None):
+        """
+        :param size:    int         max amount of sampled candidates
+        :param stratum: function    returns stratum of a candidate, if None - all candidates are in the same stratum
+        """
+        self.size = size
+        self.stratum = stratum
+        self.strata = {}  # {stratum: [(-key, candidate)]}
+        self.depth = size  # Max amount of candidates kept per stratum
+        self.count = 0  # Amount of kept candidates
+        self.prune_count = 2 * size  # Amount of kept candidates at which strata are pruned
+
+    def __len__(self):
+        return min(self.size, self.count)
+
+    def add(self, key, candidate):
+        """
+        Adds a candidate to the sample
+        :param key:       int   - candidate key
+        :param candidate: tuple - candidate
+        """
+        if self.size <= 0:
+            return
+
+        stratum = self.stratum(candidate) if self.stratum is not None else None
+        if stratum not in self.strata:
+            self.strata[stratum] = []
+        heap = self.strata[stratum]
+
+        if len(heap) < self.depth:
+            heapq.heappush(heap, (-key, candidate))
+            self.count += 1
+        elif key < -heap[0][0]:
+            heapq.heapreplace(heap, (-key, candidate))
+
+        if self.count >= self.prune_count:
+            self.prune()
+
+    def prune(self):
+        """
+        Removes candidates which cannot be selected by items: every stratum is cut to the smallest depth at which
+        strata together have size candidates
+        """
+        lengths = sorted(len(x) for x in self.strata.values())
+        depth = 0
+        total = 0  # Amount of candidates selected by levels up to depth
+        remaining = len(lengths)  # Amount of strata longer than depth
+        for length in lengths:
+            if total + remaining * (length - depth) >= self.size:
+                depth += -(-(self.size - total) // remaining)
+                break
+            total += remaining * (length - depth)
+            depth = length
+            remaining -= 1
+        else:
+            depth = self.depth
+
+        self.depth = min(self.depth, max(depth, 1))
+        for heap in self.strata.values():
+            while len(heap) > self.depth:
+                heapq.heappop(heap)
+        self.count = sum(len(x) for x in self.strata.values())
+        self.prune_count = max(2 * self.size, 2 * self.count)
+
+    def items(self):
+        """
+        Selects the sample: candidates are taken by rounds, every round takes next smallest key candidate of every
+        stratum, last incomplete round takes candidates with the smallest keys. So every stratum gets the same share
+        of the sample, unless it has fewer candidates
+        :return: list   - sampled candidates sorted
+        """
+        strata = [sorted((-x[0], x[1]) for x in heap) for heap in self.strata.values()]
+
+        result = []
+        level = 0
+        while len(result) < self.size:
+            current = sorted(x[level] for x in strata if len(x) > level)
+            if len(current) == 0:
+                break
+            result.extend(x[1] for x in current[:self.size - len(result)])
+            level += 1
+
+        return sorted(result)
+
+
+def candidate_stratum(candidate):
+    """
+    Returns stratum of a candidate: station, month and hour of day of the slice start
+    :param candidate: (float, string, float)    - candidate (see day_candidates)
+    :return: (string, int, int)
+    """
+    start_time = UTCDateTime(candidate[2])
+    return candidate[1], start_time.month, start_time.hour
+
+
+class NoisePool:
+    """
+    Picks noise in worker processes: days are sharded across workers, which find noise slice intervals of every
+    station day. Intervals are sampled with seeded stratified reservoir in the main process, then only sampled slices
+    are cut and saved by workers. Results do not depend on the amount of workers
+    """
+
+    def __init__(self, workers, archive_definitions, events):
+        """
+        :param workers:             int             number of worker processes, if less than 2 - noise is picked in
+                                                    the calling process
+        :param archive_definitions: ArchiveIndex    archive definitions index
+        :param events:              EventIndex      picks times index
+        """
+        self.workers = workers
+
+        if workers > 1:
+            self.pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(archive_definitions, events))
+        else:
+            self.pool = None
+            init_worker(archive_definitions, events)
+
+    def map(self, function, tasks, ordered=True):
+        """
+        Applies function to tasks in worker processes
+        :param function: function
+        :param tasks:    list       - tasks
+        :param ordered:  bool       - if False - results are returned in completion order
+        :return: generator of results
+        """
+        if self.pool is None:
+            return (function(x) for x in tasks)
+        if ordered:
+            return self.pool.imap(function, tasks)
+        return self.pool.imap_unordered(function, tasks)
+
+    def sample(self, days, stations, size, seed):
+        """
+        Finds noise slice intervals of stations for days and samples them
+        :param days:     [UTCDateTime]  - days
+        :param stations: [string]       - stations
+        :param size:     int            - max amount of sampled intervals
+        :param seed:     int            - sampling seed
+        :return: [(float, string, float)]   - sampled candidates sorted by day and station (see day_candidates)
+        """
+        reservoir = NoiseReservoir(size, candidate_stratum if config.noise_stratified_sampling else None)
+        for candidates in self.map(day_candidates, [(x.timestamp, stations, seed) for x in days], ordered=False):
+            for key, candidate in candidates:
+                reservoir.add(key, candidate)
+
+        return reservoir.items()
+
+    def save(self, candidates, save_dir):
+        """
+        Cuts and saves noise slices of candidates
+        :param candidates: [(float, string, float)] - candidates (see day_candidates)
+        :param save_dir:   string                   - directory to save noise picks
+        :return: int    - number of saved slices
+        """
+        return sum(self.map(save_candidate, [(x, save_dir) for x in candidates]))
+
+    def close(self):
+        """
+        Stops worker processes
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
@@ -0,0 +1,182 @@
+import logging
+from collections import namedtuple
+from obspy.core.utcdatetime import UTCDateTime
+
+import config.vars as config
+
+
+# Compact S-file records
+# NordicPick:  (string, string, string, UTCDateTime, float, float)
+#              - (station, channel, phase hint, pick time, seconds, epicentral distance)
+# NordicEvent: (string, string, UTCDateTime, float, float, [NordicPick])
+#              - (event ID, S-file path, origin time, magnitude, depth in meters, picks)
+NordicPick = namedtuple('NordicPick', ['station', 'channel', 'phase_hint', 'time', 'seconds', 'distance'])
+NordicEvent = namedtuple('NordicEvent', ['event_id', 's_file_path', 'time', 'magnitude', 'depth', 'picks'])
+
+nordic_line_length = 80  # Length of a nordic line, line type is stored in the last column
+
+
+def read_events(reading_path, output_level=0):
+    """
+    Reads S-file in a single pass and returns all its events with picks, distances, high-precision seconds,
+    magnitudes, depths and event IDs
+    :param reading_path: string     path to S-file
+    :param output_level: int        0 - min output, 5 - max output, default - 0
+    :return: [NordicEvent]          - list of events
+             -1                     - error
+    """
+    if output_level >= 5:
+        logging.info('Reading file: ' + reading_path)
+
+    try:
+        with open(reading_path, 'r') as f:
+            lines = f.readlines()
+    except (OSError, UnicodeDecodeError) as error:
+        if output_level >= 2:
+            logging.warning('In ' + reading_path + ': ' + str(error))
+        return -1
+
+    try:
+        return parse_lines(lines, reading_path)
+    except ValueError as error:
+        if output_level >= 2:
+            logging.warning('In ' + reading_path + ': ' + str(error))
+        return -1
+
+
+def parse_lines(lines, reading_path=None):
+    """
+    Parses S-file lines into events, events are separated by blank lines
+    :param lines:        [string]   S-file lines
+    :param reading_path: string     path to S-file, stored in events records
+    :return: [NordicEvent]          - list of events
+    Raises ValueError if event has corrupted header line
+    """
+    events = []
+    event_lines = []
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if len(line.strip()) == 0:
+            if len(event_lines) > 0:
+                events.append(parse_event(event_lines, reading_path))
+                event_lines = []
+            continue
+        event_lines.append(line.ljust(nordic_line_length))
+
+    if len(event_lines) > 0:
+        events.append(parse_event(event_lines, reading_path))
+
+    return events
+
+
+def parse_event(lines, reading_path=None):
+    """
+    Parses single event lines (padded to nordic line length)
+    :param lines:        [string]   event lines
+    :param reading_path: string     path to S-file, stored in event record
+    :return: NordicEvent
+    Raises ValueError if event has no header line or header line is corrupted
+    """
+    origin = None
+    date = None
+    magnitude = None
+    depth = None
+    event_id = None
+    picks = []
+    picks_started = False
+
+    for line in lines:
+        line_type = line[nordic_line_length - 1]
+
+        # Header line, only first one describes the event
+        if line_type == '1' and date is None:
+            date = UTCDateTime(int(line[1:5]), int(line[6:8]), int(line[8:10]))
+            origin = date + seconds_of_day(line[11:13], line[13:15], line[16:20])
+            depth = parse_float(line[38:43])
+            if depth is not None:
+                depth *= 1000.0
+            magnitude = parse_float(line[55:59])
+
+        # Event ID line
+        elif line_type == 'I':
+            if line[57:60] == 'ID:':
+                event_id = line[60:74].strip()
+
+        # Picks section header
+        elif line_type == '7':
+            picks_started = True
+
+        # Phase lines
+        elif picks_started and line_type in (' ', '4'):
+            pick = parse_pick(line, date)
+            if pick is not None:
+                picks.append(pick)
+
+    if date is None:
+        raise ValueError('No event header line found')
+
+    return NordicEvent(event_id, reading_path, origin, magnitude, depth, picks)
+
+
+def parse_pick(line, date):
+    """
+    Parses phase line
+    :param line: string         phase line (padded to nordic line length)
+    :param date: UTCDateTime    event date, pick times are stored as time of day of the event date
+    :return: NordicPick
+             None               - if line contains no pick time
+    """
+    if date is None or len(line[18:28].strip()) == 0:
+        return None
+
+    seconds = parse_float(line[22:28])
+    if seconds is None:
+        return None
+    if not config.seconds_high_precision:
+        seconds = float(int(seconds))
+
+    try:
+        time = date + seconds_of_day(line[18:20], line[20:22], seconds)
+    except ValueError:
+        return None
+
+    if line[14] == '_':
+        phase_hint = line[10:17].strip()
+    else:
+        phase_hint = line[10:14].strip()
+
+    return NordicPick(line[1:6].strip(), line[6:8].strip(), phase_hint, time, seconds, parse_float(line[70:75]))
+
+
+def seconds_of_day(hour, minute, seconds):
+    """
+    Converts nordic time fields to seconds passed since the start of the day (hour might be bigger than 23)
+    :param hour:    string          hour field
+    :param minute:  string          minute field
+    :param seconds: string/float    seconds field
+    :return: float
+    Raises ValueError if fields are corrupted
+    """
+    hour = hour.strip()
+    minute = minute.strip()
+    result = 0.0
+    if type(seconds) is not str or len(seconds.strip()) > 0:
+        result += float(seconds)
+    if len(hour) > 0:
+        result += int(hour) * 3600
+    if len(minute) > 0:
+        result += int(minute) * 60
+    return result
+
+
+def parse_float(field):
+    """
+    Converts nordic field to float
+    :param field: string    field
+    :return: float
+             None           - if field is empty or corrupted
+    """
+    try:
+        return float(field)
+    except ValueError:
+        return None
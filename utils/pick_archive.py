@@ -0,0 +1,151 @@
+import os
+import io
+import json
+from obspy.core import read
+
+import utils.picking_stats as stats
+
+
+# Packed picks archive: picks are appended to shards, every shard is a pair of files in the save dir:
+#   <shard>.data  - concatenated slices files contents
+#   <shard>.index - one JSON line per event: event stats parameters and every station pick stats parameters with
+#                   slices names, offsets and lengths in the data file; or a line marking event as removed
+# Index line is written after event data, so index never refers to incomplete data. Every line has write time, so
+# event saved again after removal replaces the previous one, even if it is written to another shard
+data_extension = '.data'
+index_extension = '.index'
+
+
+def slice_reference(data_path, offset, length, name):
+    """
+    Returns reference to a slice stored in a shard, used instead of slice file path. Reference ends with
+    '/' + slice file name, so it is parsed the same way as a path
+    :param data_path: string    - path to shard data file
+    :param offset:    int       - slice offset in data file
+    :param length:    int       - slice length in bytes
+    :param name:      string    - slice file name
+    :return: string
+    """
+    return '{}@{}@{}/{}'.format(data_path, offset, length, name)
+
+
+def parse_reference(reference):
+    """
+    Parses slice reference (see slice_reference)
+    :param reference: string    - slice reference or file path
+    :return: (string, int, int) - (path to shard data file, offset, length)
+             None               - not a slice reference
+    """
+    head = reference.rsplit('/', 1)[0]
+    split = head.rsplit('@', 2)
+    if len(split) != 3 or not split[0].endswith(data_extension) or not split[1].isdigit() or \
+            not split[2].isdigit():
+        return None
+    return split[0], int(split[1]), int(split[2])
+
+
+def read_slice(reference, file_format="MSEED"):
+    """
+    Reads slice by reference to a shard or by file path
+    :param reference:   string  - slice reference (see slice_reference) or path to slice file
+    :param file_format: string  - format of the slice, default: miniSEED "MSEED"
+    :return: obspy.core.stream.Stream
+    """
+    parsed = parse_reference(reference)
+    if parsed is None:
+        return read(reference, file_format)
+
+    data_path, offset, length = parsed
+    with open(data_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    return read(io.BytesIO(data), file_format)
+
+
+def read_index(index_path):
+    """
+    Reads shard index
+    :param index_path: string   - path to shard index file
+    :return: generator of dicts - index entries: saved events (with 'event' and 'picks' keys) and removed events
+                                  (with 'removed' key), every entry has write 'time'
+    """
+    with open(index_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Line was not fully written
+                continue
+
+
+def current_entries(index_paths):
+    """
+    Reads shards indexes and drops events which were removed after being saved (see picks_slicing.remove_event)
+    :param index_paths: [string]    - paths to shards index files
+    :return: [(string, dict)]       - (path to index file, saved event entry)
+    """
+    entries = []
+    removed = {}  # {event ID: last removal time}
+    for index_path in index_paths:
+        for entry in read_index(index_path):
+            if 'removed' in entry:
+                removed[entry['removed']] = max(entry['time'], removed.get(entry['removed'], 0))
+            else:
+                entries.append((index_path, entry))
+
+    result = []
+    for index_path, entry in entries:
+        event_id = dict(entry['event']).get('EventID')
+        if event_id in removed and entry['time'] < removed[event_id]:
+            continue
+        result.append((index_path, entry))
+
+    return result
+
+
+def shard_indexes(save_dir):
+    """
+    Returns shards indexes in save dir
+    :param save_dir: string     - base directory of saved picks
+    :return: [string]           - paths to shards index files
+    """
+    if not os.path.isdir(save_dir):
+        return []
+    return [save_dir + '/' + x for x in sorted(os.listdir(save_dir)) if x.endswith(index_extension)]
+
+
+def saved_event_ids(save_dir):
+    """
+    Returns IDs of events saved in packed shards
+    :param save_dir: string     - base directory of saved picks
+    :return: {string}
+    """
+    return set(dict(entry['event']).get('EventID') for _, entry in current_entries(shard_indexes(save_dir)))
+
+
+def read_events(index_paths):
+    """
+    Reads events of shards
+    :param index_paths: [string]    - paths to shards index files
+    :return: generator of (EventStats, [(SliceStats, [(slice file name, slice reference)])])
+    """
+    for index_path, entry in current_entries(index_paths):
+        data_path = index_path[:len(index_path) - len(index_extension)] + data_extension
+
+        event_stats = stats.EventStats()
+        for name, value in entry['event']:
+            event_stats.set_value(name, value)
+
+        groups = []
+        for pick in entry['picks']:
+            slice_stats = stats.SliceStats()
+            for name, value in pick['stats']:
+                slice_stats.set_value(name, value)
+
+            groups.append((slice_stats, [(x[0], slice_reference(data_path, x[1], x[2], x[0]))
+                                         for x in pick['slices']]))
+
+        yield event_stats, groups
@@ -0,0 +1,316 @@
+import os
+import io
+import json
+import time
+import shutil
+
+import utils.utils as utils
+import utils.pick_archive as pick_archive
+import utils.picks_index as picks_index
+import config.vars as config
+
+
+def time_value(time):
+    """
+    Formats stats file time parameter value
+    :param time: UTCDateTime    - time
+    :return: string             - time in format: day.month.year-hour:minute:second
+    """
+    return "{day}.{month}.{year}-{hour}:{minute}:{second}".format(day=time.day, month=time.month, year=time.year,
+                                                                 hour=time.hour, minute=time.minute,
+                                                                 second=time.second)
+
+
+def event_parameters(picks):
+    """
+    Returns event stats parameters (see picking_stats.EventStats)
+    :param picks: EventPicks    - event picks (see picks_slicing.get_picks)
+    :return: [(string, string)] - parameters names and values
+    """
+    return [("EventID", str(picks.event_id)),
+            ("SFilePath", str(picks.s_file_path)),
+            ("Magnitude", str(picks.magnitude)),
+            ("Depth", str(picks.depth))]
+
+
+def picks_parameters(picks, pick, file_format):
+    """
+    Returns picks stats parameters (see picking_stats.SliceStats)
+    :param picks:       EventPicks  - event picks (see picks_slicing.get_picks)
+    :param pick:        StationPick - station pick
+    :param file_format: string      - format of slices files
+    :return: [(string, string)]     - parameters names and values
+    """
+    parameters = [("EventID", str(picks.event_id)),
+                  ("SFilePath", str(picks.s_file_path)),
+                  ("Station", str(pick.station)),
+                  ("PhaseHint", str(pick.phase_hint)),
+                  ("Magnitude", str(picks.magnitude)),
+                  ("Depth", str(picks.depth)),
+                  ("Distance", str(pick.distance)),
+                  ("FileFormat", str(file_format))]
+
+    if len(pick.archives) > 0:
+        archive = pick.archives[0]
+        parameters.append(("WavePhaseTime", time_value(archive.pick_time)))
+        parameters.append(("WaveStartTime", time_value(archive.start_time)))
+        parameters.append(("WaveEndTime", time_value(archive.end_time)))
+
+    return parameters
+
+
+def description(title, parameters):
+    """
+    Returns stats file content
+    :param title:      string               - stats section title
+    :param parameters: [(string, string)]   - parameters names and values
+    :return: string
+    """
+    lines = [title]
+    for name, value in parameters:
+        if name in ("SFilePath", "FileFormat"):
+            lines.append("{}=\"{}\"".format(name, value))
+        else:
+            lines.append("{}={}".format(name, value))
+    return '\n'.join(lines) + '\n'
+
+
+def encode_slices(pick, file_format):
+    """
+    Encodes slices of a station pick
+    :param pick:        StationPick - station pick
+    :param file_format: string      - format of slices files
+    :return: [(string, bytes)]      - slices files names and contents
+    """
+    files = []
+    for archive in pick.archives:
+        definition = archive.definition
+        base_file_name = "{location}.{station}.{spip}.{phase}".format(location=definition.subdir,
+                                                                      station=definition.station,
+                                                                      spip=definition.channel,
+                                                                      phase=pick.phase_hint)
+        for index, trace_slice in enumerate(archive.slices):
+            if len(archive.slices) == 1:
+                file_name = "{}.{}".format(base_file_name, file_format)
+            else:
+                file_name = "{}.{}.{}".format(base_file_name, index, file_format)
+
+            buffer = io.BytesIO()
+            trace_slice.write(buffer, format=file_format)
+            files.append((file_name, buffer.getvalue()))
+
+    return files
+
+
+class DirectoryWriter:
+    """
+    Writes events picks in directories layout (see picks_slicing.read_picks): event directory with event stats file,
+    directory with picks stats file and slices files for every station pick. Event is prepared in memory first:
+    picks directories indices are computed from a single event directory listing (only if event directory already
+    exists), stats files and slices are encoded and then written with one write per file. After event files are
+    written, event metadata is appended to the writer journal (see utils/picks_index.py)
+    """
+
+    def __init__(self, save_dir, file_format="MSEED"):
+        """
+        :param save_dir:    string  - base directory of saved picks
+        :param file_format: string  - format of slices files, default - miniSEED "MSEED"
+        """
+        self.save_dir = utils.normalize_path(save_dir)
+        self.file_format = file_format
+        self.created = False  # True if base directory was already created by this writer
+        self.journal_path = '{}/picks-{}-{}{}'.format(self.save_dir, int(time.time()), os.getpid(),
+                                                      picks_index.journal_extension)
+
+    def write(self, picks):
+        """
+        Writes an event
+        :param picks: EventPicks    - event picks (see picks_slicing.get_picks)
+        :return:      -1            - error
+        """
+        # If no event ID, quit
+        if picks.event_id is None or len(picks.event_id) == 0:
+            print("In {}: Event ID is empty, cannot create save dir!".format(picks.s_file_path))
+            return -1
+
+        # Prepare files: [(directory, [(file name, bytes)])] and journal entry
+        event_dir = self.save_dir + '/' + picks.event_id
+        event_stats = description("[Event Description]", event_parameters(picks))
+        directories = [(event_dir, [(config.event_stats_file, event_stats.encode())])]
+        event = {'event': event_parameters(picks), 'directory': picks.event_id, 'picks': []}
+
+        # Create event directory, existing one is listed to find free picks directories indices
+        if not self.created:
+            os.makedirs(self.save_dir, exist_ok=True)
+            self.created = True
+        try:
+            os.mkdir(event_dir)
+            used = set()
+        except FileExistsError:
+            used = set(os.listdir(event_dir))
+
+        for pick in picks.picks:
+            index = 0
+            while "{}.{}.{}".format(pick.station, pick.phase_hint, index) in used:
+                index += 1
+            picks_name = "{}.{}.{}".format(pick.station, pick.phase_hint, index)
+            used.add(picks_name)
+
+            parameters = picks_parameters(picks, pick, self.file_format)
+            slices = encode_slices(pick, self.file_format)
+            files = [(config.picks_stats_file, description("[Picks Description]", parameters).encode())]
+            files.extend(slices)
+            directories.append((event_dir + '/' + picks_name, files))
+            event['picks'].append({'stats': parameters,
+                                   'slices': [(x[0], picks.event_id + '/' + picks_name + '/' + x[0]) for x in slices]})
+
+        # Write files
+        for directory, files in directories:
+            if directory != event_dir:
+                os.mkdir(directory)
+            for name, data in files:
+                with open(directory + '/' + name, 'wb') as f:
+                    f.write(data)
+
+        event['time'] = time.time()
+        self.journal(event)
+
+    def remove(self, event_id):
+        """
+        Removes event directory and marks event as removed in the journal
+        :param event_id: string     - event ID
+        """
+        event_dir = self.save_dir + '/' + event_id
+        if os.path.isdir(event_dir):
+            shutil.rmtree(event_dir)
+            self.journal({'removed': event_id, 'time': time.time()})
+
+    def journal(self, entry):
+        """
+        Appends an entry to the writer journal
+        :param entry: dict  - journal entry
+        """
+        if not self.created:
+            os.makedirs(self.save_dir, exist_ok=True)
+            self.created = True
+        with open(self.journal_path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+
+class PackedWriter:
+    """
+    Appends events picks to packed archive shards (see utils/pick_archive.py) instead of creating directories and
+    files for every pick. Every process writes its own shards, shard is closed after
+    config.pick_archive_shard_events events and next one is started
+    """
+
+    def __init__(self, save_dir, file_format="MSEED", shard_events=None):
+        """
+        :param save_dir:     string  - base directory of saved picks
+        :param file_format:  string  - format of slices, default - miniSEED "MSEED"
+        :param shard_events: int     - max amount of events in a shard, default - config.pick_archive_shard_events
+        """
+        self.save_dir = utils.normalize_path(save_dir)
+        self.file_format = file_format
+        self.shard_events = max(1, shard_events if shard_events is not None else config.pick_archive_shard_events)
+        self.prefix = 'picks-{}-{}'.format(int(time.time()), os.getpid())  # Shards names prefix of the writer
+        self.shards = 0  # Amount of started shards
+
+        # Current shard
+        self.data_path = None
+        self.data = None
+        self.index = None
+        self.data_size = 0
+        self.events = 0
+
+    def open_shard(self):
+        """
+        Closes current shard and starts the next one
+        """
+        self.close()
+        os.makedirs(self.save_dir, exist_ok=True)
+
+        base_path = '{}/{}-{:05d}'.format(self.save_dir, self.prefix, self.shards)
+        self.shards += 1
+        self.data_path = base_path + pick_archive.data_extension
+        self.data = open(self.data_path, 'ab')
+        self.index = open(base_path + pick_archive.index_extension, 'a')
+        self.data_size = self.data.tell()
+        self.events = 0
+
+    def write(self, picks):
+        """
+        Appends an event to the current shard
+        :param picks: EventPicks    - event picks (see picks_slicing.get_picks)
+        :return:      -1            - error
+        """
+        # If no event ID, quit
+        if picks.event_id is None or len(picks.event_id) == 0:
+            print("In {}: Event ID is empty, cannot save event!".format(picks.s_file_path))
+            return -1
+
+        if self.data is None or self.events >= self.shard_events:
+            self.open_shard()
+
+        # Prepare event data and index line
+        chunks = []
+        offset = self.data_size
+        event = {'event': event_parameters(picks), 'picks': []}
+        for pick in picks.picks:
+            slices = []
+            for name, data in encode_slices(pick, self.file_format):
+                chunks.append(data)
+                slices.append((name, offset, len(data)))
+                offset += len(data)
+            event['picks'].append({'stats': picks_parameters(picks, pick, self.file_format), 'slices': slices})
+
+        # Data first, so index never refers to unwritten data
+        self.data.write(b''.join(chunks))
+        self.data.flush()
+        self.data_size = offset
+        event['time'] = time.time()
+        self.index.write(json.dumps(event) + '\n')
+        self.index.flush()
+        self.events += 1
+
+    def remove(self, event_id):
+        """
+        Marks event as removed, its entries written earlier are ignored by readers (see utils/pick_archive.py)
+        :param event_id: string     - event ID
+        """
+        if self.data is None:
+            self.open_shard()
+
+        self.index.write(json.dumps({'removed': event_id, 'time': time.time()}) + '\n')
+        self.index.flush()
+
+    def close(self):
+        """
+        Closes current shard
+        """
+        if self.data is not None:
+            self.data.close()
+            self.index.close()
+            self.data = None
+            self.index = None
+
+
+# Writers of the process: {(save_dir, file_format): DirectoryWriter or PackedWriter}
+writers = {}
+
+
+def get_writer(save_dir, file_format="MSEED"):
+    """
+    Returns writer of the process for provided save dir, so base directory is checked only once and packed shards
+    are appended during the whole run. Writer type is set by config.picks_output_format
+    :param save_dir:    string  - base directory of saved picks
+    :param file_format: string  - format of slices files, default - miniSEED "MSEED"
+    :return: DirectoryWriter or PackedWriter
+    """
+    key = (save_dir, file_format)
+    if key not in writers:
+        if config.picks_output_format == 'packed':
+            writers[key] = PackedWriter(save_dir, file_format)
+        else:
+            writers[key] = DirectoryWriter(save_dir, file_format)
+    return writers[key]
@@ -0,0 +1,123 @@
+import multiprocessing
+from collections import deque
+
+import utils.picks_slicing as picks
+
+
+# Archive definitions of the worker process, set by init_worker
+worker_definitions = []
+
+
+def init_worker(archive_definitions):
+    """
+    Initializes picking worker process
+    :param archive_definitions: list    list of archive definitions
+    """
+    global worker_definitions
+    worker_definitions = archive_definitions
+
+
+def pick_file(reading_path, events, save_dir, rewrite=False):
+    """
+    Slices picks of S-file event and saves them, runs inside worker process (or in the main one if no workers used)
+    :param reading_path: string         path to S-file
+    :param events:       [NordicEvent]  parsed S-file events (see utils/nordic_parser.py)
+    :param save_dir:     string         base directory of saved picks
+    :param rewrite:      bool           if True - already saved event is removed before saving
+    :return: int    - number of saved phases
+             -1     - error
+    """
+    slices = picks.get_picks(reading_path, worker_definitions, events)
+    if slices == -1:
+        return -1
+
+    if rewrite:
+        picks.remove_event(slices.event_id, save_dir)
+
+    if picks.save_picks(slices, save_dir) == -1:
+        return -1
+
+    return len(slices.picks)
+
+
+class PickingPool:
+    """
+    Slices S-files events in worker processes and returns results in submission order. Amount of dispatched but
+    not yet collected files is bounded, so they can be recorded in picking statistics as in progress
+    """
+
+    def __init__(self, workers, archive_definitions, window=0):
+        """
+        :param workers:             int     number of worker processes, if less than 2 - files are sliced in the
+                                            calling process
+        :param archive_definitions: list    list of archive definitions
+        :param window:              int     max amount of files in progress, default - 2 * workers
+        """
+        self.workers = workers
+        self.window = window if window > 0 else 2 * max(workers, 1)
+        self.queue = deque()  # [(file, event ID, AsyncResult or int)]
+
+        if workers > 1:
+            self.pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(archive_definitions,))
+        else:
+            self.pool = None
+            init_worker(archive_definitions)
+
+    def submit(self, reading_path, event_id, events=None, save_dir=None, rewrite=False):
+        """
+        Dispatches S-file to a worker. If events is None - file is not processed but still kept in the results order
+        :param reading_path: string         path to S-file
+        :param event_id:     string         event ID
+        :param events:       [NordicEvent]  parsed S-file events, None if file should be skipped
+        :param save_dir:     string         base directory of saved picks
+        :param rewrite:      bool           if True - already saved event is removed before saving
+        """
+        if events is None:
+            result = None
+        elif self.pool is None:
+            result = pick_file(reading_path, events, save_dir, rewrite)
+        else:
+            result = self.pool.apply_async(pick_file, (reading_path, events, save_dir, rewrite))
+
+        self.queue.append((reading_path, event_id, result))
+
+    def full(self):
+        """
+        :return: bool   True if amount of files in progress reached the window size
+        """
+        return len(self.queue) >= self.window
+
+    def in_progress(self):
+        """
+        :return: [string]   list of files which are dispatched but not yet collected
+        """
+        return [x[0] for x in self.queue]
+
+    def event_in_progress(self, event_id):
+        """
+        :param event_id: string     event ID
+        :return: bool               True if event is dispatched but not yet collected
+        """
+        for x in self.queue:
+            if x[2] is not None and x[1] == event_id:
+                return True
+        return False
+
+    def collect(self):
+        """
+        Waits for the oldest dispatched file and returns its result
+        :return: (string, string, int)  - (S-file path, event ID, number of saved phases or -1 on error or None if
+                                          file was skipped)
+        """
+        reading_path, event_id, result = self.queue.popleft()
+        if result is not None and self.pool is not None:
+            result = result.get()
+        return reading_path, event_id, result
+
+    def close(self):
+        """
+        Stops worker processes (all results should be collected before)
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
@@ -6,6 +6,7 @@ class PickStats:
     last_file_parsed = None  # LastFileParsed
     file_currently_parsed = None  # FileCurrentlyParsed - None, if picking process successfully finished
     error_event_id = None  # ErrorEventID - Has value if aborted process during event parsing
+    files_in_progress = []  # FilesInProgress - Files dispatched to workers but not yet finished, separated by '|'
 
     total_files_parsed = 0  # TotalFilesParsed
     total_events_parsed = 0  # TotalEventsParsed
@@ -26,6 +27,8 @@ class PickStats:
                  '{}={}'.format('LastFileParsed', self.last_file_parsed),
                  '{}={}'.format('FileCurrentlyParsed', self.file_currently_parsed),
                  '{}={}'.format('ErrorEventID', self.error_event_id),
+                 '{}={}'.format('FilesInProgress', '|'.join(self.files_in_progress)
+                                if len(self.files_in_progress) > 0 else None),
 
                  '{}={}'.format('TotalFilesParsed', self.total_files_parsed),
                  '{}={}'.format('TotalEventsParsed', self.total_events_parsed),
@@ -98,6 +101,11 @@ class PickStats:
                 self.error_event_id = None
             else:
                 self.error_event_id = str(value)
+        elif name == 'FilesInProgress':
+            if value is None or value == 'None' or len(value) == 0:
+                self.files_in_progress = []
+            else:
+                self.files_in_progress = str(value).split('|')
 
         elif name == 'TotalFilesParsed':
             self.total_files_parsed = int(value)
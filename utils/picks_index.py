@@ -0,0 +1,490 @@
+import os
+import json
+import time
+import logging
+import numpy as np
+from obspy.core.utcdatetime import UTCDateTime
+
+import utils.utils as utils
+import utils.picking_stats as stats
+import utils.pick_archive as pick_archive
+import config.vars as config
+
+
+# Picks metadata index: stats of all saved events and picks stored in columns, so picks are filtered with vectorised
+# queries instead of reading stats files of every event and pick directory.
+# Index is compiled from metadata journals written by picks writers at save time (see utils/pick_writers.py):
+#   <name>.journal - one JSON line per event saved in directories layout, slices paths are relative to save dir
+#   <shard>.index  - packed picks shard index (see utils/pick_archive.py)
+# Both have removal lines. Compiled index is persisted in save dir with amount of bytes read from every journal, so
+# only new lines are read on refresh. Event directories not found in journals (saved before the index was
+# introduced) are read from the tree
+journal_extension = '.journal'
+
+# Columns: (name, dtype), string values are stored as str(value), so None is 'None' like in stats files
+event_columns = [('event_id', 'U'), ('s_file_path', 'U'), ('magnitude', np.float64), ('depth', np.float64),
+                 ('time', np.float64), ('directory', 'U')]  # directory is empty for events in packed picks shards
+pick_columns = [('event', np.int64), ('event_id', 'U'), ('s_file_path', 'U'), ('station', 'U'),
+                ('phase_hint', 'U'), ('magnitude', np.float64), ('depth', np.float64), ('distance', np.float64),
+                ('file_format', 'U'), ('phase_time', np.float64), ('start_time', np.float64),
+                ('end_time', np.float64)]
+slice_columns = [('pick', np.int64), ('name', 'U'), ('path', 'U'), ('channel', 'U'), ('file_format', 'U'),
+                 ('valid', np.bool_)]
+
+
+def text(value):
+    """
+    Converts stats value to text column value
+    :param value: object    - stats value
+    :return: string         - str(value), so None is 'None'
+    """
+    return str(value)
+
+
+def number(value):
+    """
+    Converts stats value to number column value
+    :param value: float     - stats value or None
+    :return: float          - value, numpy.nan for None
+    """
+    return np.nan if value is None else float(value)
+
+
+def timestamp(value):
+    """
+    Converts stats time to timestamp column value
+    :param value: UTCDateTime   - stats time or None
+    :return: float              - timestamp, numpy.nan for None
+    """
+    return np.nan if value is None else value.timestamp
+
+
+def from_text(value):
+    """
+    Converts text column value back to stats value
+    :param value: string    - column value
+    :return: string or None
+    """
+    return None if value == 'None' else str(value)
+
+
+def from_number(value):
+    """
+    Converts number column value back to stats value
+    :param value: float     - column value
+    :return: float or None
+    """
+    return None if np.isnan(value) else float(value)
+
+
+def from_timestamp(value):
+    """
+    Converts timestamp column value back to stats time
+    :param value: float     - column value
+    :return: UTCDateTime or None
+    """
+    return None if np.isnan(value) else UTCDateTime(value)
+
+
+def empty_columns(columns):
+    """
+    Returns empty columns
+    :param columns: [(string, dtype)]   - columns definition
+    :return: {string: numpy.ndarray}
+    """
+    return {name: np.array([], dtype=dtype) for name, dtype in columns}
+
+
+class PicksIndex:
+    """
+    Columnar index of saved picks metadata (see description above): event, pick and slice columns, picks refer to
+    events rows and slices refer to picks rows
+    """
+
+    def __init__(self, save_dir, path=None, output_level=0):
+        """
+        :param save_dir:     string  - base directory of saved picks
+        :param path:         string  - path to persisted index, default - config.picks_index_file in save dir,
+                                       if empty - index is kept only in memory
+        :param output_level: int     - 0 - min output, 5 - max output, default - 0
+        """
+        self.save_dir = utils.normalize_path(save_dir)
+        self.path = path if path is not None else self.save_dir + '/' + config.picks_index_file
+        self.output_level = output_level
+        self.reset()
+
+    def reset(self):
+        """
+        Clears index
+        """
+        self.events = empty_columns(event_columns)
+        self.picks = empty_columns(pick_columns)
+        self.slices = empty_columns(slice_columns)
+        self.sources = {}  # {journal file name: amount of bytes read}
+        self.removed = {}  # {event ID: last removal time}
+        self.changed = False  # True if index was changed since it was loaded
+
+    def __len__(self):
+        return len(self.picks['event'])
+
+    def load(self):
+        """
+        Loads persisted index, index built for another save dir is ignored
+        """
+        if len(self.path) == 0 or not os.path.isfile(self.path):
+            return
+
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(str(data['meta']))
+                if meta.get('root') != self.save_dir:
+                    return
+                self.events = {name: data['event_' + name] for name, _ in event_columns}
+                self.picks = {name: data['pick_' + name] for name, _ in pick_columns}
+                self.slices = {name: data['slice_' + name] for name, _ in slice_columns}
+        except (OSError, ValueError, KeyError) as error:
+            if self.output_level >= 2:
+                logging.warning('Cannot load picks index ' + self.path + ': ' + str(error))
+            self.reset()
+            return
+
+        self.sources = meta['sources']
+        self.removed = meta['removed']
+
+    def save(self):
+        """
+        Persists index to the file
+        """
+        if len(self.path) == 0:
+            return
+
+        meta = {'root': self.save_dir, 'sources': self.sources, 'removed': self.removed}
+        arrays = {'meta': np.array(json.dumps(meta))}
+        arrays.update({'event_' + name: x for name, x in self.events.items()})
+        arrays.update({'pick_' + name: x for name, x in self.picks.items()})
+        arrays.update({'slice_' + name: x for name, x in self.slices.items()})
+        try:
+            # File object is used, so numpy does not append .npz extension
+            with open(self.path, 'wb') as f:
+                np.savez(f, **arrays)
+        except OSError as error:
+            if self.output_level >= 2:
+                logging.warning('Cannot save picks index ' + self.path + ': ' + str(error))
+
+    def refresh(self, from_tree=False):
+        """
+        Reads new journals lines and event directories not found in journals. If a journal was truncated or removed,
+        index is compiled again
+        :param from_tree: bool  - if True - events saved in directories layout are read from the tree instead of
+                                  journals, used to rebuild index after event directories were changed manually
+        :return: {string}       - event directories in save dir
+        """
+        journals = {}
+        directories = set()
+        with os.scandir(self.save_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    directories.add(entry.name)
+                elif entry.name.endswith(journal_extension) or entry.name.endswith(pick_archive.index_extension):
+                    journals[entry.name] = entry.stat().st_size
+
+        if any(name not in journals or journals[name] < size for name, size in self.sources.items()):
+            if self.output_level >= 3:
+                logging.info('Picks index: journals changed, compiling index again')
+            self.reset()
+            self.changed = True
+
+        rows = (empty_rows(event_columns), empty_rows(pick_columns), empty_rows(slice_columns))
+        for name in sorted(journals):
+            offset = self.sources.get(name, 0)
+            if offset < journals[name]:
+                self.sources[name] = offset + self.read_journal(name, offset, rows, from_tree)
+                self.changed = True
+
+        # Event directories which are not in journals
+        indexed = set()
+        if not from_tree:
+            indexed = set(self.events['directory']) | set(rows[0]['directory'])
+        scan_time = time.time()
+        for directory in sorted(directories - indexed):
+            stats_path = self.save_dir + '/' + directory + '/' + config.event_stats_file
+            if not os.path.isfile(stats_path):
+                continue
+            event_stats = stats.EventStats()
+            event_stats.read(stats_path)
+            add_event(rows, event_stats, directory_groups(self.save_dir, directory), scan_time, directory)
+
+        self.append(rows)
+        if self.output_level >= 3:
+            logging.info('Picks index: {} events, {} picks, {} slices'.format(len(self.events['event_id']),
+                                                                            len(self.picks['event']),
+                                                                            len(self.slices['pick'])))
+        return directories
+
+    def read_journal(self, name, offset, rows, skip_directories=False):
+        """
+        Reads complete lines of a journal starting from offset into rows
+        :param name:             string  - journal file name
+        :param offset:           int     - offset in journal file
+        :param rows:             tuple   - event, pick and slice rows (see empty_rows)
+        :param skip_directories: bool    - if True - events saved in directories layout are skipped
+        :return: int    - amount of bytes read, incomplete last line is not read
+        """
+        with open(self.save_dir + '/' + name, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+
+        packed = name.endswith(pick_archive.index_extension)
+        data_name = name[:len(name) - len(pick_archive.index_extension)] + pick_archive.data_extension
+        for line in data[:end].split(b'\n'):
+            if len(line.strip()) == 0:
+                continue
+            try:
+                entry = json.loads(line.decode())
+            except ValueError:
+                continue
+
+            if 'removed' in entry:
+                self.removed[entry['removed']] = max(entry['time'], self.removed.get(entry['removed'], 0))
+                continue
+            if skip_directories and not packed:
+                continue
+
+            event_stats = stats.EventStats()
+            for parameter, value in entry['event']:
+                event_stats.set_value(parameter, value)
+
+            groups = []
+            for pick in entry['picks']:
+                slice_stats = stats.SliceStats()
+                for parameter, value in pick['stats']:
+                    slice_stats.set_value(parameter, value)
+                if packed:
+                    files = [(x[0], pick_archive.slice_reference(data_name, x[1], x[2], x[0])) for x in pick['slices']]
+                else:
+                    files = [(x[0], x[1]) for x in pick['slices']]
+                groups.append((slice_stats, files))
+
+            add_event(rows, event_stats, groups, entry['time'], '' if packed else entry['directory'])
+
+        return end
+
+    def append(self, rows):
+        """
+        Appends rows to index columns
+        :param rows: tuple  - event, pick and slice rows (see empty_rows)
+        """
+        event_rows, pick_rows, slice_rows = rows
+        pick_rows['event'] = [x + len(self.events['event_id']) for x in pick_rows['event']]
+        slice_rows['pick'] = [x + len(self.picks['event']) for x in slice_rows['pick']]
+
+        for columns, new_rows, definition in ((self.events, event_rows, event_columns),
+                                              (self.picks, pick_rows, pick_columns),
+                                              (self.slices, slice_rows, slice_columns)):
+            if len(new_rows[definition[0][0]]) == 0:
+                continue
+            self.changed = True
+            for name, dtype in definition:
+                columns[name] = np.concatenate([columns[name], np.array(new_rows[name], dtype=dtype)])
+
+    def query(self, directories, phase_hint=None, min_magnitude=None, max_depth=None, max_distance=None,
+              stations=None):
+        """
+        Selects events and picks
+        :param directories:   {string}  - event directories in save dir (see refresh)
+        :param phase_hint:    string    - phase of picks, if None - all phases
+        :param min_magnitude: float     - minimal event magnitude, if None - not checked
+        :param max_depth:     float     - maximal event depth, if None - not checked
+        :param max_distance:  float     - maximal distance to station, if None - not checked
+        :param stations:      [string]  - stations of picks, if None - all stations
+        :return: (numpy.ndarray, numpy.ndarray) - events and picks masks, events with unknown magnitude or depth are
+                                                  selected, picks of events which are not selected are not selected
+        """
+        events = self.events
+        removed = np.array([self.removed.get(x, -np.inf) for x in events['event_id']], dtype=np.float64)
+        event_mask = events['time'] >= removed
+        event_mask &= (events['directory'] == '') | np.isin(events['directory'], list(directories))
+        if min_magnitude is not None:
+            event_mask &= ~(events['magnitude'] < min_magnitude)
+        if max_depth is not None:
+            event_mask &= ~(events['depth'] > max_depth)
+
+        picks = self.picks
+        pick_mask = event_mask[picks['event']]
+        if phase_hint is not None:
+            pick_mask &= picks['phase_hint'] == str(phase_hint)
+        if max_distance is not None:
+            pick_mask &= ~(picks['distance'] > max_distance)
+        if stations is not None:
+            pick_mask &= np.isin(picks['station'], list(stations))
+
+        return event_mask, pick_mask
+
+    def read(self, directories, phase_hint):
+        """
+        Returns picks of specified phase in read_picks format (see picks_slicing.read_picks). Events and slices are
+        filtered the same way as picks_slicing.event_picks_list does
+        :param directories: {string}    - event directories in save dir (see refresh)
+        :param phase_hint:  string      - specified phase
+        :return: [[EventStats, [SliceStats, slice file path, ...], ...], ...]
+        """
+        event_mask, pick_mask = self.query(directories, phase_hint, config.min_magnitude, config.max_depth)
+
+        slices = self.slices
+        slice_mask = slices['valid'] & pick_mask[slices['pick']]
+        slice_mask &= slices['file_format'] == self.picks['file_format'][slices['pick']]
+        if config.ignore_acc:
+            slice_mask &= ~np.isin(slices['channel'], list(config.acc_codes))
+
+        paths = {}  # {pick row: [slice file path]}
+        for row in np.flatnonzero(slice_mask):
+            paths.setdefault(slices['pick'][row], []).append(self.save_dir + '/' + slices['path'][row])
+
+        # Events saved to the same directory several times are merged, like in the tree
+        result = []
+        event_lists = {}  # {event row: event list}
+        directory_lists = {}  # {event directory: event list}
+        events = self.events
+        for row in np.flatnonzero(event_mask):
+            directory = events['directory'][row]
+            if directory in directory_lists:
+                event_lists[row] = directory_lists[directory]
+                continue
+
+            event_stats = stats.EventStats()
+            event_stats.event_id = from_text(events['event_id'][row])
+            event_stats.s_file_path = from_text(events['s_file_path'][row])
+            event_stats.magnitude = from_number(events['magnitude'][row])
+            event_stats.depth = from_number(events['depth'][row])
+
+            event_lists[row] = [event_stats]
+            if len(directory) > 0:
+                directory_lists[directory] = event_lists[row]
+            result.append(event_lists[row])
+
+        picks = self.picks
+        for row in np.flatnonzero(pick_mask):
+            slice_stats = stats.SliceStats()
+            slice_stats.event_id = from_text(picks['event_id'][row])
+            slice_stats.s_file_path = from_text(picks['s_file_path'][row])
+            slice_stats.station = from_text(picks['station'][row])
+            slice_stats.phase_hint = from_text(picks['phase_hint'][row])
+            slice_stats.magnitude = from_number(picks['magnitude'][row])
+            slice_stats.depth = from_number(picks['depth'][row])
+            slice_stats.distance = from_number(picks['distance'][row])
+            slice_stats.file_format = from_text(picks['file_format'][row])
+            slice_stats.phase_time = from_timestamp(picks['phase_time'][row])
+            slice_stats.start_time = from_timestamp(picks['start_time'][row])
+            slice_stats.end_time = from_timestamp(picks['end_time'][row])
+
+            event_lists[picks['event'][row]].append([slice_stats] + paths.get(row, []))
+
+        return result
+
+
+def empty_rows(columns):
+    """
+    Returns empty rows, rows are collected in lists and appended to index columns at once (see PicksIndex.append)
+    :param columns: [(string, dtype)]   - columns definition
+    :return: {string: list}
+    """
+    return {name: [] for name, _ in columns}
+
+
+def add_event(rows, event_stats, groups, write_time, directory):
+    """
+    Adds event to rows
+    :param rows:        tuple       - event, pick and slice rows (see empty_rows), pick and slice rows refer to rows
+                                      positions, not to index rows
+    :param event_stats: EventStats  - event stats
+    :param groups:      iterable    - event pick groups: (SliceStats, [(slice file name, slice path relative to
+                                      save dir)])
+    :param write_time:  float       - event write time
+    :param directory:   string      - event directory name, empty for events in packed picks shards
+    """
+    event_rows, pick_rows, slice_rows = rows
+
+    event = len(event_rows['event_id'])
+    event_rows['event_id'].append(text(event_stats.event_id))
+    event_rows['s_file_path'].append(text(event_stats.s_file_path))
+    event_rows['magnitude'].append(number(event_stats.magnitude))
+    event_rows['depth'].append(number(event_stats.depth))
+    event_rows['time'].append(write_time)
+    event_rows['directory'].append(directory)
+
+    for slice_stats, files in groups:
+        pick = len(pick_rows['event'])
+        pick_rows['event'].append(event)
+        pick_rows['event_id'].append(text(slice_stats.event_id))
+        pick_rows['s_file_path'].append(text(slice_stats.s_file_path))
+        pick_rows['station'].append(text(slice_stats.station))
+        pick_rows['phase_hint'].append(text(slice_stats.phase_hint))
+        pick_rows['magnitude'].append(number(slice_stats.magnitude))
+        pick_rows['depth'].append(number(slice_stats.depth))
+        pick_rows['distance'].append(number(slice_stats.distance))
+        pick_rows['file_format'].append(text(slice_stats.file_format))
+        pick_rows['phase_time'].append(timestamp(slice_stats.phase_time))
+        pick_rows['start_time'].append(timestamp(slice_stats.start_time))
+        pick_rows['end_time'].append(timestamp(slice_stats.end_time))
+
+        for name, path in files:
+            # Slice file name: location.station.channel.phase.format
+            name_split = name.split('.')
+            valid = len(name_split) == 5
+            slice_rows['pick'].append(pick)
+            slice_rows['name'].append(name)
+            slice_rows['path'].append(path)
+            slice_rows['channel'].append(name_split[2] if valid else '')
+            slice_rows['file_format'].append(name_split[4] if valid else '')
+            slice_rows['valid'].append(valid)
+
+
+def directory_groups(save_dir, directory, relative=True):
+    """
+    Reads pick groups of an event directory
+    :param save_dir:  string    - base directory of saved picks
+    :param directory: string    - event directory name
+    :param relative:  bool      - if True - slice paths are relative to save dir, otherwise they start with save dir,
+                                  default - True
+    :return: generator of (SliceStats, [(slice file name, slice path)])
+    """
+    event_dir = save_dir + '/' + directory
+    prefix = directory if relative else event_dir
+    for subdir in os.listdir(event_dir):
+        if os.path.isfile(event_dir + '/' + subdir):
+            continue
+
+        slice_stats = stats.SliceStats()
+        slice_stats.read(event_dir + '/' + subdir + '/' + config.picks_stats_file)
+
+        yield slice_stats, [(x, prefix + '/' + subdir + '/' + x) for x in os.listdir(event_dir + '/' + subdir)]
+
+
+def read_picks(save_dir, phase_hint, output_level=0):
+    """
+    Reads picks of specified phase using index persisted in save dir, index is refreshed and persisted
+    :param save_dir:     string  - base directory of saved picks
+    :param phase_hint:   string  - specified phase
+    :param output_level: int     - 0 - min output, 5 - max output, default - 0
+    :return: [[EventStats, [SliceStats, slice file path, ...], ...], ...]
+    """
+    index = PicksIndex(save_dir, output_level=output_level)
+    index.load()
+    directories = index.refresh()
+    if index.changed or not os.path.isfile(index.path):
+        index.save()
+    return index.read(directories, phase_hint)
+
+
+def rebuild(save_dir, output_level=0):
+    """
+    Compiles index of save dir again, events saved in directories layout are read from the tree
+    :param save_dir:     string  - base directory of saved picks
+    :param output_level: int     - 0 - min output, 5 - max output, default - 0
+    :return: PicksIndex
+    """
+    index = PicksIndex(save_dir, output_level=output_level)
+    index.refresh(from_tree=True)
+    index.save()
+    return index
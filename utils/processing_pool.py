@@ -0,0 +1,81 @@
+import multiprocessing
+from collections import deque
+
+import utils.hdf5_composer as composer
+import config.vars as config
+
+
+class ProcessingPool:
+    """
+    Processes picks files in worker processes. Tasks are sent to workers in batches (every batch is processed with
+    hdf5_composer.process_tasks) and results are returned in tasks order, so composed hdf5 file does not depend on
+    the amount of workers. Amount of dispatched but not yet consumed batches is bounded, so processed picks do not
+    pile up in memory if they are consumed slower than processed
+    """
+
+    def __init__(self, jobs, batch_size=None, window=0):
+        """
+        :param jobs:       int  number of worker processes, if less than 2 - picks are processed in the calling process
+        :param batch_size: int  amount of tasks sent to a worker at once, default - config.processing_batch_size
+        :param window:     int  max amount of batches in progress, default - 2 * jobs
+        """
+        self.jobs = jobs
+        self.batch_size = max(1, batch_size if batch_size is not None else config.processing_batch_size)
+        self.window = window if window > 0 else 2 * max(jobs, 1)
+
+        if jobs > 1:
+            self.pool = multiprocessing.Pool(jobs)
+        else:
+            self.pool = None
+
+    def imap(self, tasks):
+        """
+        Processes tasks (see hdf5_composer.process_task). Tasks are taken from the iterable only when there is room
+        in the window, so if generator is not consumed further, no more tasks are dispatched
+        :param tasks: iterable of tasks
+        :return: generator of processed picks or None for skipped ones, in tasks order
+        """
+        batches = task_batches(tasks, self.batch_size)
+        if self.pool is None:
+            for batch in batches:
+                for result in composer.process_tasks(batch):
+                    yield result
+            return
+
+        queue = deque()  # [AsyncResult]
+        for batch in batches:
+            queue.append(self.pool.apply_async(composer.process_tasks, (batch,)))
+            if len(queue) < self.window:
+                continue
+            for result in queue.popleft().get():
+                yield result
+
+        while len(queue) > 0:
+            for result in queue.popleft().get():
+                yield result
+
+    def close(self):
+        """
+        Stops worker processes, tasks which results were not consumed are dropped
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+
+
+def task_batches(tasks, batch_size):
+    """
+    Groups tasks into batches
+    :param tasks:      iterable of tasks
+    :param batch_size: int  - max amount of tasks in a batch
+    :return: generator of tasks lists
+    """
+    batch = []
+    for task in tasks:
+        batch.append(task)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if len(batch) > 0:
+        yield batch
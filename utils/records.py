@@ -0,0 +1,72 @@
+class Record:
+    """
+    Base class for compact records: fields are stored in __slots__ (no per-instance __dict__) and are
+    initialized positionally in the order of __slots__
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        if len(values) != len(self.__slots__):
+            raise TypeError('{} expects {} values, got {}'.format(type(self).__name__, len(self.__slots__),
+                                                                  len(values)))
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        fields = ', '.join('{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__)
+        return '{}({})'.format(type(self).__name__, fields)
+
+
+# Archive definition from SEISAN.DEF (see utils/seisan_reader.py)
+class ArchiveDefinition(Record):
+    __slots__ = ('station',     # string
+                 'channel',     # string
+                 'subdir',      # string        - network code (archive subdirectory)
+                 'location',    # string
+                 'start_date',  # UTCDateTime
+                 'end_date')    # UTCDateTime   - None if archive still continues
+
+
+# Slice of archive traces for a single pick and archive definition (get_picks)
+class ArchiveSlices(Record):
+    __slots__ = ('definition',    # ArchiveDefinition
+                 'archive_path',  # string      - path to day archive
+                 'start_time',    # UTCDateTime - slice start
+                 'end_time',      # UTCDateTime - slice end
+                 'pick_time',     # UTCDateTime
+                 'slices')        # [obspy.core.trace.Trace] - traces slices
+
+
+# Single pick of an event with slices from all station archives (get_picks)
+class StationPick(Record):
+    __slots__ = ('station',     # string
+                 'phase_hint',  # string
+                 'distance',    # float         - None if not specified in S-file
+                 'archives')    # [ArchiveSlices]
+
+
+# All picks of an event (get_picks)
+class EventPicks(Record):
+    __slots__ = ('event_id',     # string
+                 's_file_path',  # string
+                 'magnitude',    # float
+                 'depth',        # float        - in meters
+                 'picks')        # [StationPick]
+
+
+# Single channel slice saved by save_traces (slice_from_reading, noise-picker)
+class PickSlice(Record):
+    __slots__ = ('trace',       # obspy.core.trace.Trace
+                 'file_name',   # string        - base name of the slice file
+                 'station',     # string
+                 'channel',     # string
+                 'slice_id',    # string        - station/archive based ID, used as dir name if no event ID
+                 'phase_hint',  # string        - 'P', 'S' or 'N' for noise
+                 'event_id')    # string        - S-file event ID, None for noise
+
+
+# Processed single channel slice ready for hdf5 packing (see utils/hdf5_composer.py)
+class ProcessedSlice(Record):
+    __slots__ = ('data',        # numpy.ndarray - processed samples
+                 'file_name',   # string        - path to slice file
+                 'event_id')    # string
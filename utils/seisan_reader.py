@@ -4,20 +4,28 @@ import obspy.io.nordic.core as nordic_reader
 from obspy.core import read
 from obspy.core import utcdatetime
 import logging
+from bisect import bisect_left, bisect_right
 import utils.converter as converter
+from utils.records import ArchiveDefinition
 
-import utils.converter as converter
+
+# Parsed definitions files: {path: (modification time, [definitions])}
+definitions_files = {}
 
 
 def read_archive_definitions(reading_path, output_level=0):
     """
-    Reads SEISAN DEFINITIONS file and returns all archive definitions tuples list
+    Reads SEISAN DEFINITIONS file and returns all archive definitions list
     :param reading_path: string     path to definitions file
     :param output_level: int        0 - min output, 5 - max output, default - 0
-    :return: [(string, string, string, string, UTCDateTime, UTCDateTime)] - list of tuples like (station, channel, subdir, location, start date, end date)
-                                                                            - end date might be None if absent (if archive still continues)
-             -1                                                           - error
+    :return: [ArchiveDefinition]    - list of archive definitions (see utils/records.py), end date might be None
+                                      if absent (if archive still continues)
+             -1                     - error
     """
+    mtime = os.path.getmtime(reading_path)
+    if reading_path in definitions_files and definitions_files[reading_path][0] == mtime:
+        return list(definitions_files[reading_path][1])
+
     f = open(reading_path, "r")
     if f.mode != 'r':
         if output_level >= 0:
@@ -25,6 +33,7 @@ def read_archive_definitions(reading_path, output_level=0):
         return -1
 
     content = f.readlines()
+    f.close()
     data = []
     for x in content:
         data_tuple = archive_def(x)
@@ -32,7 +41,8 @@ def read_archive_definitions(reading_path, output_level=0):
         if data_tuple is not None:
             data.append(data_tuple)
 
-    return data
+    definitions_files[reading_path] = (mtime, data)
+    return list(data)
 
 
 def find_station_archive_definitions(reading_path, station_name, output_level=0):
@@ -41,37 +51,23 @@ def find_station_archive_definitions(reading_path, station_name, output_level=0)
     :param reading_path: string     path to definitions file
     :param station_name: string     name of the station
     :param output_level: int        0 - min output, 5 - max output, default - 0
-    :return: [(string, string, string, string, UTCDateTime, UTCDateTime)] - list of tuples like (station, channel,
-                                                                            subdir, location, start date, end date)
-                                                                            end date might be None if absent (if archive
-                                                                            still continues)
-             -1                                                           - error
+    :return: [ArchiveDefinition]    - list of archive definitions (see utils/records.py), end date might be None
+                                      if absent (if archive still continues)
+             -1                     - error
     """
-    f = open(reading_path, "r")
-    if f.mode != 'r':
-        if output_level >= 0:
-            logging.error("Can't open seisan def file: " + reading_path)
+    definitions = read_archive_definitions(reading_path, output_level)
+    if definitions == -1:
         return -1
 
-    content = f.readlines()
-    data = []
-    for x in content:
-        data_tuple = archive_def(x)
-
-        if data_tuple is not None and data_tuple[0] == station_name:
-            data.append(data_tuple)
-
-    return data
+    return station_archives(definitions, station_name)
 
 
 def archive_def(definition_line):
     """
-    Converts seisan archive definition string to a tuple (string, string, string, string, UTCDateTime, UTCDateTime)
-    which means (station, channel, subdir, location, start date, end date)
+    Converts seisan archive definition string to ArchiveDefinition (station, channel, subdir, location, start date,
+    end date)
     :param definition_line: string      archive definition line
-    :return: (string, string, string, string, UTCDateTime, UTCDateTime)
-                                        - archive definition tuple
-                                        (station, channel, subdir, location, start date, end date)
+    :return: ArchiveDefinition          - archive definition (see utils/records.py)
              None                       - if line is not an station archive definition
     """
     instances = definition_line.split()
@@ -82,14 +78,11 @@ def archive_def(definition_line):
         location = instances[2][5:7]
         start_date = converter.utcdatetime_from_string(instances[3])
 
+        end_date = None
         if len(instances) == 5:
             end_date = converter.utcdatetime_from_string(instances[4])
 
-            data_tuple = (station, channel, subdir, location, start_date, end_date)
-        else:
-            data_tuple = (station, channel, subdir, location, start_date, None)
-
-        return data_tuple
+        return ArchiveDefinition(station, channel, subdir, location, start_date, end_date)
 
     return None
 
@@ -104,7 +97,8 @@ def get_archive_list(archive_definition, defs):
     """
     archives = []
     for x in defs:
-        if x[0] == archive_definition[0] and x[2] == archive_definition[2] and x[3] == archive_definition[3]:
+        if x.station == archive_definition.station and x.subdir == archive_definition.subdir and \
+                x.location == archive_definition.location:
             archives.append(x)
 
     return archives
@@ -113,8 +107,7 @@ def get_archive_list(archive_definition, defs):
 def archive_path(archive_definition, year, day, archive_dir='', output_level=0):
     """
     Returns path in archives dir to an archive file
-    archive_definition format: (station, channel, subdir, location, start date, end date)
-    :param archive_definition: tuple        - archive definition tuple (see archive_def method)
+    :param archive_definition: ArchiveDefinition - archive definition (see archive_def method)
     :param year:               string/int   - year of record
     :param day:                string/int   - day of record
     :param archive_dir:        string       - path to archive directories, empty by default
@@ -126,10 +119,10 @@ def archive_path(archive_definition, year, day, archive_dir='', output_level=0):
         logging.warning("In archive_path: day value is bigger than 365")
 
     # Subdirectories:
-    path = archive_definition[2] + '/' + archive_definition[0] + '/'
+    path = archive_definition.subdir + '/' + archive_definition.station + '/'
     # Record file:
-    path += archive_definition[0] + '.' + archive_definition[2] + '.'  # station.subdir.
-    path += archive_definition[3] + '.' + archive_definition[1] + '.'  # location.channel
+    path += archive_definition.station + '.' + archive_definition.subdir + '.'  # station.subdir.
+    path += archive_definition.location + '.' + archive_definition.channel + '.'  # location.channel
 
     year_str = str(year)
     while len(year_str) != 4:
@@ -150,18 +143,140 @@ def archive_path(archive_definition, year, day, archive_dir='', output_level=0):
 def station_archives(archive_definitions, station):
     """
     Returns archive definitions list for provided station
-    :param archive_definitions: list    - list of archive definitions
+    :param archive_definitions: list    - list of archive definitions or ArchiveIndex
     :param station:             string  - station name
     :return:                    list    - list of archive definitions
     """
+    if isinstance(archive_definitions, ArchiveIndex):
+        return archive_definitions.station_archives(station)
+
     search_result = []
     for x in archive_definitions:
-        if x[0] == station:
+        if x.station == station:
             search_result.append(x)
 
     return search_result
 
 
+def find_station_archives(archive_definitions, station, time, end_time=None):
+    """
+    Returns archive definitions of the station which are valid for provided time interval
+    :param archive_definitions: list        - list of archive definitions or ArchiveIndex
+    :param station:             string      - station name
+    :param time:                UTCDateTime - interval start, archive should start not later than that
+    :param end_time:            UTCDateTime - interval end, archive should not end earlier than that,
+                                              if None - same as time
+    :return:                    list        - list of archive definitions
+    """
+    if isinstance(archive_definitions, ArchiveIndex):
+        return archive_definitions.find(station, time, end_time)
+
+    if end_time is None:
+        end_time = time
+
+    search_result = []
+    for x in station_archives(archive_definitions, station):
+        if x.start_date > time:
+            continue
+        if x.end_date is not None and end_time > x.end_date:
+            continue
+        search_result.append(x)
+
+    return search_result
+
+
+class ArchiveIndex:
+    """
+    Archive definitions index: maps stations to their definitions sorted by start date and by end date, so
+    definitions valid for a station and time are found with binary search: only definitions which started before the
+    interval or only definitions which end after it are checked, whichever are fewer. Search results keep the order of
+    definitions in the definitions file
+    """
+
+    def __init__(self, archive_definitions):
+        """
+        :param archive_definitions: list    list of archive definitions (see archive_def method)
+        """
+        self.definitions = list(archive_definitions)
+        # {station: ([definitions], [start timestamps], [(position, definition)], [end timestamps],
+        #            [(position, definition)])}, definitions are in file order, then sorted by start and by end
+        self.stations = {}
+
+        grouped = {}
+        for position, x in enumerate(self.definitions):
+            if x.station not in grouped:
+                grouped[x.station] = []
+            grouped[x.station].append((position, x))
+
+        for station, definitions in grouped.items():
+            by_start = sorted(definitions, key=lambda y: y[1].start_date)
+            by_end = sorted(definitions, key=lambda y: end_timestamp(y[1]))
+            self.stations[station] = ([x[1] for x in definitions],
+                                      [x[1].start_date.timestamp for x in by_start], by_start,
+                                      [end_timestamp(x[1]) for x in by_end], by_end)
+
+    def __len__(self):
+        return len(self.definitions)
+
+    def __iter__(self):
+        return iter(self.definitions)
+
+    def station_archives(self, station):
+        """
+        Returns archive definitions list for provided station
+        :param station: string  - station name
+        :return:        list    - list of archive definitions
+        """
+        if station not in self.stations:
+            return []
+        return list(self.stations[station][0])
+
+    def find(self, station, time, end_time=None):
+        """
+        Returns archive definitions of the station which are valid for provided time interval
+        :param station:  string         - station name
+        :param time:     UTCDateTime    - interval start, archive should start not later than that
+        :param end_time: UTCDateTime    - interval end, archive should not end earlier than that,
+                                          if None - same as time
+        :return:         list           - list of archive definitions
+        """
+        if station not in self.stations:
+            return []
+
+        if end_time is None:
+            end_time = time
+
+        starts, by_start, ends, by_end = self.stations[station][1:]
+        started = bisect_right(starts, time.timestamp)  # Definitions by_start[:started] start not later than time
+        ending = bisect_left(ends, end_time.timestamp)  # Definitions by_end[ending:] end not earlier than end time
+
+        result = []
+        if started <= len(ends) - ending:
+            for position, x in by_start[:started]:
+                if x.end_date is not None and end_time > x.end_date:
+                    continue
+                result.append((position, x))
+        else:
+            for position, x in by_end[ending:]:
+                if x.start_date > time:
+                    continue
+                result.append((position, x))
+
+        result.sort()
+        return [x[1] for x in result]
+
+
+def end_timestamp(definition):
+    """
+    Returns end timestamp of archive definition
+    :param definition: ArchiveDefinition    - archive definition
+    :return:           float                - end date timestamp, infinity if archive has no end date
+    """
+    if definition.end_date is None:
+        return float('inf')
+    return definition.end_date.timestamp
+
+
 def normalize_path(path):
     """
     Normalizes provided path to: /something/something/something
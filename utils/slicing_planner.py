@@ -0,0 +1,137 @@
+import logging
+
+import utils.seisan_reader as seisan
+import utils.archive_cache as archive_cache
+import utils.archive_files as archive_files
+from utils.records import ArchiveSlices, StationPick, EventPicks
+import config.vars as config
+
+
+class EventPlan:
+    """
+    Slicing state of a single event: picks structure in get_picks format (see utils/picks_slicing.py) which is
+    filled with slices while day archives are processed
+    """
+
+    def __init__(self, task, event, picks_list):
+        """
+        :param task:       object           caller task object, returned with event slices
+        :param event:      NordicEvent      parsed event (see utils/nordic_parser.py)
+        :param picks_list: [StationPick]    event picks, filled with archive slices
+        """
+        self.task = task
+        self.event = event
+        self.picks_list = picks_list
+        self.pending = set()  # Day archives which are not yet processed for this event
+        self.error = False
+
+    def slices(self):
+        """
+        :return: EventPicks - event slices in get_picks format
+                 -1         - error during slicing
+        """
+        if self.error:
+            return -1
+        return EventPicks(self.event.event_id, self.event.s_file_path, self.event.magnitude, self.event.depth,
+                          self.picks_list)
+
+
+class SlicingPlan:
+    """
+    Plans picks slicing for a list of events: all required day archives reads are grouped by archive file and
+    archives are processed in chronological order, so every day archive is read exactly once
+    """
+
+    def __init__(self, archive_definitions, output_level=0):
+        """
+        :param archive_definitions: list    list of archive definitions
+        :param output_level:        int     0 - min output, 5 - max output, default - 0
+        """
+        self.archive_definitions = archive_definitions
+        self.output_level = output_level
+        self.events = []  # [EventPlan] sorted by event time
+        self.reads = {}  # {archive path: (day key, [(EventPlan, ArchiveSlices)])}
+
+    def add(self, task, event):
+        """
+        Adds event to the plan
+        :param task:  object        caller task object, returned with event slices
+        :param event: NordicEvent   parsed event (see utils/nordic_parser.py)
+        """
+        picks_list = []
+        plan = EventPlan(task, event, picks_list)
+
+        for pick in event.picks:
+            time = pick.time
+            station_archives = seisan.find_station_archives(self.archive_definitions, pick.station, time,
+                                                            time + config.slice_duration -
+                                                            config.static_slice_offset)
+
+            archives_picks = []
+            for x in station_archives:
+                archive_path = seisan.archive_path(x, time.year, time.julday, config.archives_path)
+                if not archive_files.exists(archive_path):
+                    continue
+
+                start_time = time - config.static_slice_offset
+                end_time = start_time + config.slice_duration
+
+                archive_pick = ArchiveSlices(x, archive_path, start_time, end_time, time, [])
+                archives_picks.append(archive_pick)
+
+                if archive_path not in self.reads:
+                    self.reads[archive_path] = ((time.year, time.julday, archive_path), [])
+                self.reads[archive_path][1].append((plan, archive_pick))
+                plan.pending.add(archive_path)
+
+            picks_list.append(StationPick(pick.station, pick.phase_hint, pick.distance, archives_picks))
+
+        self.events.append(plan)
+
+    def run(self):
+        """
+        Slices all planned events. Day archives are read in chronological order, event is returned as soon as all
+        its archives are processed
+        :return: generator of (task, slices) - slices are in get_picks format or -1 on error
+        """
+        self.events.sort(key=lambda y: y.event.time)
+
+        # Events without archives reads are finished right away
+        for plan in self.events:
+            if len(plan.pending) == 0:
+                yield plan.task, plan.slices()
+
+        for archive_path in sorted(self.reads, key=lambda y: self.reads[y][0]):
+            requests = self.reads.pop(archive_path)[1]
+
+            try:
+                archive_st = archive_cache.read(archive_path)
+            except TypeError as e:
+                print("In {}: {}".format(archive_path, e))  # Throw exception?
+                archive_st = None
+
+            finished = []
+            for plan, archive_pick in requests:
+                if archive_st is None:
+                    plan.error = True
+                else:
+                    for trace in archive_st:
+                        if trace.stats.starttime > archive_pick.start_time or \
+                                archive_pick.end_time >= trace.stats.endtime:
+                            continue
+
+                        # Copy slice data, so day archive can be released
+                        trace_slice = trace.slice(archive_pick.start_time, archive_pick.end_time).copy()
+                        archive_pick.slices.append(trace_slice)
+
+                if archive_path in plan.pending:
+                    plan.pending.remove(archive_path)
+                    if len(plan.pending) == 0:
+                        finished.append(plan)
+
+            if self.output_level >= 3:
+                logging.info('Archive ' + archive_path + ': ' + str(len(requests)) + ' slices requested')
+
+            finished.sort(key=lambda y: y.event.time)
+            for plan in finished:
+                yield plan.task, plan.slices()